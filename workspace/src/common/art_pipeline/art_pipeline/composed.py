@@ -0,0 +1,81 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import rclpy
+from rclpy.executors import MultiThreadedExecutor
+
+import argparse
+
+from cone_detector.object_recognition import ObjectRecognitionNode
+from path_planning.path_planning import PathPlanningNode
+from control.control import ControlNode
+
+from art_pipeline.handoff import InProcessHandOff
+
+# Runs perception, path planning and control in one process. Objects and paths are
+# handed between the nodes in process, camera images, vehicle state and vehicle inputs
+# stay on DDS. Parameters are set per node name as with the separate executables.
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Composed perception, planning and control pipeline.')
+    parser.add_argument('--mirror_internal', action='store_true',
+                        help="also publish objects and paths on DDS for external observers")
+    parser.add_argument('--threads', type=int, default=4,
+                        help="executor threads")
+    parsed, unknown = parser.parse_known_args()
+
+    rclpy.init(args=args)
+    perception = ObjectRecognitionNode()
+    planner = PathPlanningNode()
+    control = ControlNode()
+
+    # replace the internal subscriptions with in process hand-offs
+    planner.destroy_subscription(planner.sub_objects)
+    control.destroy_subscription(control.sub_path)
+    perception.pub_objects[0] = InProcessHandOff(planner, planner.objects_callback,
+                                                 perception.pub_objects[0] if parsed.mirror_internal else None)
+    planner.pub_path = InProcessHandOff(control, control.path_callback,
+                                        planner.pub_path if parsed.mirror_internal else None)
+
+    executor = MultiThreadedExecutor(num_threads=parsed.threads)
+    for node in [perception, planner, control]:
+        executor.add_node(node)
+
+    try:
+        executor.spin()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.shutdown()
+        for node in [control, planner, perception]:
+            node.destroy_node()
+        rclpy.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import threading
+
+# Hands messages from a publisher in one node to a subscription callback of another
+# node in the same process, without serializing them through DDS. Like a depth 1
+# subscription only the newest message is kept. The callback runs on the executor in
+# the receiving node's default callback group, so it never overlaps with that node's
+# timers, same as when the message arrives over DDS.
+class InProcessHandOff():
+    def __init__(self, node, callback, publisher=None):
+        self.callback = callback
+        # optional DDS publisher the messages are also sent on, for external observers
+        self.publisher = publisher
+        self.lock = threading.Lock()
+        self.msg = None
+        self.guard = node.create_guard_condition(self.deliver)
+
+    def publish(self, msg):
+        with self.lock:
+            self.msg = msg
+        self.guard.trigger()
+        if(self.publisher is not None):
+            self.publisher.publish(msg)
+
+    def deliver(self):
+        with self.lock:
+            msg = self.msg
+            self.msg = None
+        if(msg is not None):
+            self.callback(msg)
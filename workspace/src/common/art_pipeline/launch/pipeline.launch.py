@@ -0,0 +1,60 @@
+from launch import LaunchDescription
+from launch.actions import DeclareLaunchArgument, OpaqueFunction
+from launch.substitutions import LaunchConfiguration
+from launch_ros.actions import Node
+
+# perception -> planning -> control, either as three processes talking over DDS or
+# composed into one process with in process hand-off (composed:=true). Run both on the
+# same input with control latency_report_period set to compare end-to-end latency.
+
+def topics(context):
+    return {
+        'image': LaunchConfiguration('image_topic').perform(context),
+        'vehicle_state': LaunchConfiguration('vehicle_state_topic').perform(context),
+        'vehicle_inputs': LaunchConfiguration('vehicle_inputs_topic').perform(context),
+    }
+
+def remaps(node, t):
+    # external topics of every node, the same in both layouts
+    rules = {
+        'object_recognition_node': [('~/input/image', t['image']), ('~/input/vehicle_state', t['vehicle_state'])],
+        'path_planning_node': [('~/input/vehicle_state', t['vehicle_state'])],
+        'control_node': [('~/input/vehicle_state', t['vehicle_state']), ('~/output/vehicle_inputs', t['vehicle_inputs'])],
+    }
+    return rules[node]
+
+def launch_setup(context):
+    t = topics(context)
+    params = LaunchConfiguration('params_file').perform(context)
+    parameters = [params] if params != "" else []
+
+    if(LaunchConfiguration('composed').perform(context) == "true"):
+        ros_arguments = []
+        for node in ['object_recognition_node', 'path_planning_node', 'control_node']:
+            for src, dst in remaps(node, t):
+                ros_arguments += ['-r', '{}:{}:={}'.format(node, src, dst)]
+        # no name here, it would rename all three nodes of the process
+        return [Node(package='art_pipeline', executable='composed',
+                     parameters=parameters, ros_arguments=ros_arguments, output='screen')]
+
+    # internal topics connected over DDS
+    objects = [('~/output/objects', '/perception/objects')]
+    path = [('~/output/path', '/planning/path')]
+    return [
+        Node(package='cone_detector', executable='object_recognition', name='object_recognition_node',
+             parameters=parameters, remappings=remaps('object_recognition_node', t) + objects, output='screen'),
+        Node(package='path_planning', executable='path_planning', name='path_planning_node',
+             parameters=parameters, remappings=remaps('path_planning_node', t) + [('~/input/objects', '/perception/objects')] + path, output='screen'),
+        Node(package='control', executable='pid', name='control_node',
+             parameters=parameters, remappings=remaps('control_node', t) + [('~/input/path', '/planning/path')], output='screen'),
+    ]
+
+def generate_launch_description():
+    return LaunchDescription([
+        DeclareLaunchArgument('composed', default_value='false'),
+        DeclareLaunchArgument('params_file', default_value=''),
+        DeclareLaunchArgument('image_topic', default_value='/sensing/fwc/raw/image'),
+        DeclareLaunchArgument('vehicle_state_topic', default_value='/vehicle/state'),
+        DeclareLaunchArgument('vehicle_inputs_topic', default_value='/control/vehicle_inputs'),
+        OpaqueFunction(function=launch_setup),
+    ])
@@ -0,0 +1,244 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+from multiprocessing import shared_memory, resource_tracker
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# Single producer ring buffer of records in shared memory. A record is a dict of named
+# numpy arrays. Every slot is guarded by a sequence number that is odd while the slot
+# is being written, so readers never block the writer and retry on a torn read.
+#
+# layout: header [magic, slots, slot_size, records written, generation, writer pid] as
+# uint64, then per slot [sequence, length] as uint64 followed by slot_size bytes of
+# payload. The generation is random per writer, so readers can tell a restarted writer's
+# segment apart
+
+MAGIC = 0x41525456495333  # "ARTVIS3"
+HEADER_SIZE = 48
+SLOT_HEADER_SIZE = 16
+ALIGN = 8
+
+def segment_name(channel):
+    return "art_vis_" + channel
+
+def record_size(arrays):
+    # payload bytes needed to store a record of arrays shaped like these
+    return 4 + len(descriptor(arrays)) + ALIGN + sum(np.asarray(a).nbytes + ALIGN for a in arrays.values())
+
+# segments created by writers of this process
+written_segments = set()
+
+def open_segment(name):
+    # attaches to a segment of a writer. The resource tracker would unlink it when this
+    # process exits, so the segment is kept from the tracker unless a writer of this
+    # process created it and owns the registration
+    if(sys.version_info >= (3, 13)):
+        return shared_memory.SharedMemory(name, track=False)
+    shm = shared_memory.SharedMemory(name)
+    if(name not in written_segments and os.name == "posix"):
+        # posix segments are registered under their name with a leading slash
+        resource_tracker.unregister("/" + shm.name, "shared_memory")
+    return shm
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def live_writer(name):
+    # pid of the writer of an existing segment if that process is still running, else None
+    shm = open_segment(name)
+    pid = None
+    if(shm.size >= HEADER_SIZE):
+        header = np.ndarray((6), dtype=np.uint64, buffer=shm.buf)
+        if(int(header[0]) == MAGIC and process_alive(int(header[5]))):
+            pid = int(header[5])
+        del header
+    shm.close()
+    return pid
+
+def descriptor(arrays):
+    return json.dumps([[k, np.asarray(a).dtype.str, list(np.shape(a))] for k, a in arrays.items()]).encode()
+
+class SharedRing():
+    def __init__(self, shm):
+        self.shm = shm
+        self.header = np.ndarray((6), dtype=np.uint64, buffer=shm.buf)
+        self.slots = int(self.header[1])
+        self.slot_size = int(self.header[2])
+        stride = SLOT_HEADER_SIZE + self.slot_size
+        self.slot_headers = [np.ndarray((2), dtype=np.uint64, buffer=shm.buf, offset=HEADER_SIZE + i*stride) for i in range(self.slots)]
+        self.payloads = [shm.buf[HEADER_SIZE + i*stride + SLOT_HEADER_SIZE:HEADER_SIZE + (i+1)*stride] for i in range(self.slots)]
+
+    def close(self):
+        # views into the buffer have to be released before the segment can be closed
+        self.header = None
+        self.slot_headers = []
+        for p in self.payloads:
+            p.release()
+        self.payloads = []
+        self.shm.close()
+
+class SharedRingWriter(SharedRing):
+    def __init__(self, channel, slot_size=1<<20, slots=4):
+        name = segment_name(channel)
+        size = HEADER_SIZE + slots*(SLOT_HEADER_SIZE + slot_size)
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            pid = live_writer(name)
+            if(pid is not None):
+                raise FileExistsError("shared ring '{}' is in use by the writer in process {}".format(channel, pid))
+            # left behind by a writer that did not shut down cleanly
+            stale = shared_memory.SharedMemory(name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+
+        self.name = name
+        written_segments.add(name)
+
+        header = np.ndarray((6), dtype=np.uint64, buffer=shm.buf)
+        header[:] = [MAGIC, slots, slot_size, 0, int.from_bytes(os.urandom(8), "little"), os.getpid()]
+        del header
+        super().__init__(shm)
+        self.written = 0
+        self.dropped = 0
+
+    def write(self, arrays):
+        # copies the arrays into the next slot, returns False if the record does not fit
+        desc = descriptor(arrays)
+        if(record_size(arrays) > self.slot_size):
+            self.dropped += 1
+            return False
+
+        n = self.written
+        slot = n % self.slots
+        slot_header = self.slot_headers[slot]
+        payload = self.payloads[slot]
+
+        slot_header[0] = 2*n + 1
+        payload[0:4] = len(desc).to_bytes(4, "little")
+        payload[4:4+len(desc)] = desc
+        offset = 4 + len(desc)
+        for a in arrays.values():
+            a = np.asarray(a)
+            offset += -offset % ALIGN
+            np.copyto(np.ndarray(a.shape, dtype=a.dtype, buffer=payload, offset=offset), a)
+            offset += a.nbytes
+        slot_header[1] = offset
+        slot_header[0] = 2*n + 2
+
+        self.written = n + 1
+        self.header[3] = self.written
+        return True
+
+    def close(self):
+        super().close()
+        self.shm.unlink()
+        written_segments.discard(self.name)
+
+class SharedRingReader():
+    def __init__(self, channel, reattach_time=1.0):
+        self.name = segment_name(channel)
+        self.reattach_time = reattach_time
+        self.ring = None
+        self.generation = None
+        self.last_read = 0
+        self.last_time = 0.0
+
+    def attach(self):
+        try:
+            shm = open_segment(self.name)
+        except FileNotFoundError:
+            return False
+        if(int(np.ndarray((1), dtype=np.uint64, buffer=shm.buf)[0]) != MAGIC):
+            shm.close()
+            return False
+        self.ring = SharedRing(shm)
+        # reattaching to the same writer continues after the last record read
+        generation = int(self.ring.header[4])
+        if(generation != self.generation):
+            self.generation = generation
+            self.last_read = 0
+        self.last_time = time.time()
+        return True
+
+    def read(self, retries=3):
+        # newest record not read yet, None if there is none
+        now = time.time()
+        if(self.ring is not None and now - self.last_time > self.reattach_time):
+            # the writer may have restarted with a new segment
+            self.close()
+        if(self.ring is None and not self.attach()):
+            return None
+
+        for i in range(retries):
+            n = int(self.ring.header[3])
+            if(n <= self.last_read):
+                return None
+            slot = (n - 1) % self.ring.slots
+            slot_header = self.ring.slot_headers[slot]
+            seq = int(slot_header[0])
+            if(seq != 2*n):
+                continue
+            data = bytes(self.ring.payloads[slot][0:int(slot_header[1])])
+            if(int(slot_header[0]) != seq):
+                continue
+            self.last_read = n
+            self.last_time = now
+            return decode(data)
+        return None
+
+    def close(self):
+        if(self.ring is not None):
+            self.ring.close()
+            self.ring = None
+
+def decode(data):
+    length = int.from_bytes(data[0:4], "little")
+    offset = 4 + length
+    arrays = {}
+    for name, dtype, shape in json.loads(data[4:offset]):
+        dtype = np.dtype(dtype)
+        offset += -offset % ALIGN
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += count * dtype.itemsize
+    return arrays
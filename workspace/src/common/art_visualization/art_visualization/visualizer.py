@@ -0,0 +1,170 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import argparse
+import time
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+import matplotlib.patches as patches
+
+from art_visualization.shared_ring import SharedRingReader
+
+# Renders the records nodes push into their shared memory rings (see shared_ring.py).
+# Runs as its own process at its own rate, so drawing never blocks the nodes.
+
+# image encodings as (channels, order of r,g,b within a pixel)
+ENCODINGS = {"rgb8": (3, [0, 1, 2]), "rgba8": (4, [0, 1, 2]), "bgr8": (3, [2, 1, 0]), "bgra8": (4, [2, 1, 0])}
+
+def decode_image(record, stride):
+    h, w, step = [int(v) for v in record['image_size']]
+    encoding = record['encoding'].tobytes().decode()
+    channels, order = ENCODINGS.get(encoding, (3, [0, 1, 2]))
+    img = record['image'].reshape(h, step)[:, 0:w*channels].reshape(h, w, channels)
+    return img[::stride, ::stride, order]
+
+class DetectionRenderer():
+    # image with the detected boxes, labels, scores and ground positions
+    def __init__(self, stride):
+        self.stride = stride
+        self.fig, self.ax = plt.subplots()
+        self.fig.canvas.manager.set_window_title("Object Recognition")
+        self.im_show = None
+        self.artists = []
+
+    def draw(self, record):
+        boxes = record['boxes']
+        labels = record['labels']
+        scores = record['scores']
+        positions = record['positions']
+
+        h, w = int(record['image_size'][0]), int(record['image_size'][1])
+        x = decode_image(record, self.stride)
+        if self.im_show is None:
+            self.im_show = self.ax.imshow(x, extent=(0, w, h, 0))
+        else:
+            self.im_show.set_data(x)
+
+        [a.remove() for a in self.artists]
+        self.artists.clear()
+
+        for b in range(boxes.shape[0]):
+            color = 'r' if int(labels[b])==1 else 'g'
+            rect = patches.Rectangle((boxes[b, 0], boxes[b, 1]), boxes[b, 2]-boxes[b, 0], boxes[b, 3]-boxes[b,1], linewidth=1, edgecolor=color, facecolor='none')
+            self.ax.add_patch(rect)
+            self.artists.append(rect)
+
+            self.artists.append(self.ax.text(boxes[b, 0], boxes[b, 1], "{:.2f}".format(scores[b]), fontsize=8))
+            self.artists.append(self.ax.text(boxes[b, 0], boxes[b, 3], "{:.2f},{:.2f},{:.2f}".format(
+                positions[b, 0],positions[b, 1],positions[b, 2]), fontsize=8))
+
+class PathRenderer():
+    # cones, track boundaries and target point in the vehicle frame
+    def __init__(self):
+        self.fig, self.ax = plt.subplots()
+        self.fig.canvas.manager.set_window_title("Path Planning")
+        self.ax.set_xlim((-1,11))
+        self.ax.set_ylim((-6,6))
+        self.left_boundary, = self.ax.plot([], [], c='g')
+        self.right_boundary, = self.ax.plot([], [], c='r')
+        self.left_cones, = self.ax.plot([], [], 'o', c='g')
+        self.right_cones, = self.ax.plot([], [], 'o', c='r')
+        self.target, = self.ax.plot([], [], 'o', c='b')
+
+    def draw(self, record):
+        self.left_boundary.set_data(record['left_boundary'][0], record['left_boundary'][1])
+        self.right_boundary.set_data(record['right_boundary'][0], record['right_boundary'][1])
+        self.left_cones.set_data(record['left_cones'][:,0], record['left_cones'][:,1])
+        self.right_cones.set_data(record['right_cones'][:,0], record['right_cones'][:,1])
+        self.target.set_data(record['target'][0:1], record['target'][1:2])
+
+class TrajectoryRenderer():
+    # filtered and measured positions, the history is kept here instead of in the node
+    def __init__(self):
+        self.fig, self.ax = plt.subplots()
+        self.fig.canvas.manager.set_window_title("Kalman Filter")
+        self.ax.set_xlabel('Position_x (m)')
+        self.ax.set_ylabel('Position_y (m)')
+        self.filtered = []
+        self.measured = []
+        self.filtered_line, = self.ax.plot([], [], label='KF predictions', color='b', linewidth=0.5)
+        self.measured_line, = self.ax.plot([], [], label='Measured Position', color='r')
+        self.ax.legend()
+
+    def draw(self, record):
+        self.filtered.append(record['filtered'])
+        self.measured.append(record['measured'])
+        filtered = np.asarray(self.filtered)
+        measured = np.asarray(self.measured)
+        self.filtered_line.set_data(filtered[:,0], filtered[:,1])
+        self.measured_line.set_data(measured[:,0], measured[:,1])
+        self.ax.relim()
+        self.ax.autoscale_view()
+
+def main():
+    parser = argparse.ArgumentParser(description='Shared memory visualizer for the ART nodes.')
+    parser.add_argument('--channels', type=str, nargs='+', default=["cone_detector", "path_planning", "state_estimation"],
+                        choices=["cone_detector", "path_planning", "state_estimation"], help="channels to render")
+    parser.add_argument('--rate', type=float, default=10.0,
+                        help="redraws per second")
+    parser.add_argument('--image_stride', type=int, default=2,
+                        help="only every image_stride-th pixel of camera images is drawn")
+    args, unknown = parser.parse_known_args()
+
+    matplotlib.use("TKAgg")
+    readers = {}
+    renderers = {}
+    for c in args.channels:
+        readers[c] = SharedRingReader(c)
+        if(c == "cone_detector"):
+            renderers[c] = DetectionRenderer(args.image_stride)
+        elif(c == "path_planning"):
+            renderers[c] = PathRenderer()
+        else:
+            renderers[c] = TrajectoryRenderer()
+
+    print("=== Starting Visualizer: {} ===".format(", ".join(args.channels)))
+    try:
+        while(True):
+            t0 = time.time()
+            for c in args.channels:
+                record = readers[c].read()
+                if(record is not None):
+                    renderers[c].draw(record)
+            plt.pause(max(1e-4, 1/args.rate - (time.time() - t0)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for r in readers.values():
+            r.close()
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,7 @@ from nav_msgs.msg import Path
 from ament_index_python.packages import get_package_share_directory
 import numpy as np
 import os
+from collections import deque
 
 from rclpy.qos import QoSHistoryPolicy
 from rclpy.qos import QoSProfile
@@ -70,6 +71,12 @@ class ControlNode(Node):
         self.declare_parameter('throttle_gain', 1.0)
         self.throttle_gain = self.get_parameter('throttle_gain').get_parameter_value().double_value
 
+        # every latency_report_period seconds, log the end-to-end latency from the camera
+        # image a path was planned on to the vehicle input sent for it, 0 disables it
+        self.declare_parameter('latency_report_period', 0.0)
+        self.latency_report_period = self.get_parameter('latency_report_period').get_parameter_value().double_value
+        self.latencies = deque(maxlen=1000)
+
         self.declare_parameter("use_sim_msg", False)
         use_sim_msg = self.get_parameter("use_sim_msg").get_parameter_value().bool_value
 
@@ -105,6 +112,8 @@ class ControlNode(Node):
         self.sub_state = self.create_subscription(VehicleState, '~/input/vehicle_state', self.state_callback, qos_profile)
         self.pub_vehicle_cmd = self.create_publisher(VehicleInput, '~/output/vehicle_inputs', 10)
         self.timer = self.create_timer(1/self.freq, self.pub_callback)
+        if(self.latency_report_period > 0):
+            self.latency_timer = self.create_timer(self.latency_report_period, self.latency_callback)
 
     # function to process data this class subscribes to
     def state_callback(self, msg):
@@ -144,6 +153,19 @@ class ControlNode(Node):
         msg.throttle = np.clip(self.throttle, 0, 1)
         msg.braking = np.clip(self.braking, 0, 1)
         self.pub_vehicle_cmd.publish(msg)
+
+        stamp = self.path.header.stamp
+        if(self.latency_report_period > 0 and (stamp.sec != 0 or stamp.nanosec != 0)):
+            now = self.get_clock().now().nanoseconds
+            self.latencies.append((now - (stamp.sec * 1000000000 + stamp.nanosec)) / 1e9)
+
+    def latency_callback(self):
+        if(len(self.latencies) == 0):
+            return
+        latencies = np.asarray(self.latencies)
+        self.get_logger().info('End-to-end latency (image to vehicle input) over %s commands: p50= %s, p95= %s, max= %s' % (
+            str(len(latencies)), "{:.4f}".format(np.percentile(latencies, 50)), "{:.4f}".format(np.percentile(latencies, 95)), "{:.4f}".format(np.max(latencies))))
+        self.latencies.clear()
         
 
     def calc_inputs_from_file(self):
@@ -6,8 +6,6 @@ from sensor_msgs.msg import Imu, NavSatFix, MagneticField
 #from sensor_msgs.msg import NavSatFix
 from ament_index_python.packages import get_package_share_directory
 
-import matplotlib.pyplot as plt
-import matplotlib
 import math
 import numpy as np
 
@@ -22,17 +20,23 @@ sys.path.insert(0, os.path.abspath(ament_tools_root))
 
 from KalmanFilter import KalmanFilter
 from Chrono_coordinate_transfer import graph
+from art_visualization.shared_ring import SharedRingWriter
 class StateEstimationNode(Node):
     def __init__(self):
         super().__init__('state_estimation_node')
 
         #update frequency of this node
         self.freq = 10.0
-        matplotlib.use("TKAgg")
+
+        # READ IN PARAMETERS
+        self.declare_parameter('vis', False)
+        self.vis = self.get_parameter('vis').get_parameter_value().bool_value
+        if(self.vis):
+            # drawn by the art_visualization visualizer process
+            self.vis_ring = SharedRingWriter("state_estimation")
+
         #data that will be used by this class
         #TODO: a lot of these variables aren't used, this data needs to be cleaned up
-        self.fig = plt.figure()
-        self.fig.suptitle('Kalman Filter', fontsize = 20)
         self.gps = ""
         self.groundTruth = ""
         #self.imu = ""
@@ -154,15 +158,9 @@ class StateEstimationNode(Node):
         self.hkfx.append(self.kfx)
         self.hkfy.append(self.kfy)
         
-        plt.cla()
-        plt.plot(self.hkfx, self.hkfy, label = 'KF predictions', color = 'b', linewidth = 0.5)
-     #   plt.plot(self.htx, self.hty, label = 'True Position', color = 'g', linewidth = 0.5)
-        plt.plot(self.hx, self.hy, label='Measured Position', color = 'r')
-        plt.xlabel('Position_x (m)', fontsize=20)
-        plt.ylabel('Position_y (m)', fontsize=20)
-        plt.legend()
-        plt.draw()
-        plt.pause(0.0001)
+        # the visualizer keeps the history, only the newest positions are pushed
+        if(self.vis):
+            self.vis_ring.write({'filtered': np.array([self.kfx, self.kfy]), 'measured': np.array([self.x, self.y])})
         error = math.sqrt((self.x)**2 + self.y**2) - math.sqrt(self.kfx**2+self.kfy**2)
         self.accumulated_error = self.accumulated_error + abs(error)
 
@@ -179,13 +177,24 @@ class StateEstimationNode(Node):
         self.kf_y.update(self.y*self.kf_data_multiplier)
         self.kfx = self.kf_x.predict()[0]/self.kf_data_multiplier
         self.kfy = self.kf_y.predict()[0]/self.kf_data_multiplier
+
+    def destroy_node(self):
+        if(self.vis):
+            self.vis_ring.close()
+        super().destroy_node()
+
 def main(args=None):
     print("=== Starting State Estimation Node ===")
     rclpy.init(args=args)
     estimator = StateEstimationNode()
-    rclpy.spin(estimator)
-    estimator.destroy_node()
-    rclpy.shutdown()
+    # also on ctrl-c, so the visualization ring is unlinked
+    try:
+        rclpy.spin(estimator)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        estimator.destroy_node()
+        rclpy.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -39,11 +39,9 @@ from nav_msgs.msg import Path
 
 from rclpy.qos import QoSHistoryPolicy
 from rclpy.qos import QoSProfile
+from art_visualization.shared_ring import SharedRingWriter
 
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 from scipy.interpolate import interp1d,splev,splprep
 import os
 import json
@@ -72,6 +70,8 @@ class PathPlanningNode(Node):
 
         self.green_cones = np.array([])
         self.red_cones = np.array([])
+        # stamp of the image the newest objects were detected in, passed on with the path
+        self.objects_stamp = None
 
         self.go = False
 
@@ -82,14 +82,8 @@ class PathPlanningNode(Node):
         self.sub_objects = self.create_subscription(ObjectArray, '~/input/objects', self.objects_callback, qos_profile)
 
         if self.vis:
-            matplotlib.use("TKAgg")
-            self.fig, self.ax = plt.subplots()
-            plt.title("Path Planning")
-            self.patches = []
-            self.ax.set_xlim((-1,11))
-            self.ax.set_ylim((-6,6))
-            self.left_boundary = None
-            self.right_boundary = None
+            # drawn by the art_visualization visualizer process
+            self.vis_ring = SharedRingWriter("path_planning")
             
         #publishers
         self.pub_path = self.create_publisher(Path, '~/output/path', 10)
@@ -105,6 +99,7 @@ class PathPlanningNode(Node):
         # self.objects = msg
 
         self.go = True
+        self.objects_stamp = msg.header.stamp
     
         self.green_cones = []
         self.red_cones = []
@@ -177,32 +172,8 @@ class PathPlanningNode(Node):
         # self.get_logger().info("B Left Spline: %s" % (str(len(b_left))))
         
         if(self.vis):
-            [p.remove() for p in self.patches]
-            self.patches.clear()
-
-            if(self.left_boundary == None):
-                self.left_boundary, = self.ax.plot(b_left[0],b_left[1],c='g')
-            else:
-                self.left_boundary.set_data(b_left[0],b_left[1])
-
-            if(self.right_boundary == None):
-                self.right_boundary, = self.ax.plot(b_right[0],b_right[1],c='r')
-            else:
-                self.right_boundary.set_data(b_right[0],b_right[1])
-
-            for pos in right:
-                circ = patches.Circle(pos[0:2],radius=.1,color='r')
-                self.ax.add_patch(circ)
-                self.patches.append(circ)
-
-            for pos in left:
-                circ = patches.Circle(pos[0:2],radius=.1,color='g')
-                self.ax.add_patch(circ)
-                self.patches.append(circ)
-
-            circ = patches.Circle(target_pt,radius=.1,color='b')
-            self.ax.add_patch(circ)
-            self.patches.append(circ)
+            self.vis_ring.write({'left_boundary': np.asarray(b_left), 'right_boundary': np.asarray(b_right),
+                                 'left_cones': left, 'right_cones': right, 'target': target_pt})
 
         return target_pt
 
@@ -211,13 +182,10 @@ class PathPlanningNode(Node):
         if(not self.go):
             return
         msg = Path()
+        msg.header.stamp = self.objects_stamp
             
-        target_pt = self.plan_path()
-
         #calculate path from current cone locations
-        if(self.vis):
-            plt.draw()
-            plt.pause(0.0001)
+        target_pt = self.plan_path()
 
         pt = PoseStamped()
         pt.pose.position.x = target_pt[0]
@@ -225,13 +193,23 @@ class PathPlanningNode(Node):
         msg.poses.append(pt)
         self.pub_path.publish(msg)
 
+    def destroy_node(self):
+        if(self.vis):
+            self.vis_ring.close()
+        super().destroy_node()
+
 def main(args=None):
     # print("=== Starting Path Planning Node ===")
     rclpy.init(args=args)
     planner = PathPlanningNode()
-    rclpy.spin(planner)
-    planner.destroy_node()
-    rclpy.shutdown()
+    # also on ctrl-c, so the visualization ring is unlinked
+    try:
+        rclpy.spin(planner)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        planner.destroy_node()
+        rclpy.shutdown()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,146 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import torch
+import torch.nn.functional as F
+
+# random flip, zoom, crop, translation and color changes applied to a whole batch at once.
+# The geometric changes of every image are combined into one affine transform that is
+# sampled with grid_sample, and the boxes are moved with the same transform. Boxes that
+# leave the image get label 0. Uses the parameter ranges of ObjectDetectionImgLoader
+class BatchAugmentation():
+    def __init__(self, flip_prob=0.5, max_zoom=2.0, max_translation=(0.2,0.2), brightness=(0.75,1.33),
+                 sharpness=(0.25,4.0), saturation=(0.75,1.33), contrast=(0.75,1.33), seed=None):
+        self.flip_prob = flip_prob
+        self.max_zoom = max_zoom
+        self.max_translation = max_translation
+        self.brightness = brightness
+        self.sharpness = sharpness
+        self.saturation = saturation
+        self.contrast = contrast
+
+        # without a seed every run draws different augmentations
+        self.generator = torch.Generator()
+        if(seed is None):
+            self.generator.seed()
+        else:
+            self.generator.manual_seed(seed)
+
+        self.gray = torch.tensor([0.299, 0.587, 0.114])
+
+    def uniform(self, n, low, high):
+        return low + (high - low) * torch.rand(n, generator=self.generator)
+
+    def __call__(self, imgs, boxes, labels, counts=None):
+        # imgs is a (B,3,H,W) uint8 or [0,1] float batch, boxes (B,N,4) pixel boxes and labels
+        # (B,N). Ragged targets are passed as (M,4) boxes and (M) labels with the number of
+        # boxes of each image in counts. Returns the augmented [0,1] float32 batch, boxes
+        # and labels
+        if(imgs.dtype == torch.uint8):
+            imgs = imgs.float() / 255.0
+        imgs, boxes, labels = self.geometric(imgs, boxes, labels, counts)
+        return self.color(imgs), boxes, labels
+
+    def geometric(self, imgs, boxes, labels, counts=None):
+        n, height, width = imgs.shape[0], imgs.shape[2], imgs.shape[3]
+
+        flip = torch.rand(n, generator=self.generator) > self.flip_prob
+        zoom = self.uniform(n, 1.0, self.max_zoom)
+        crop_x = torch.floor(self.uniform(n, 0.0, 0.9) * (zoom - 1) * width)
+        crop_y = torch.floor(self.uniform(n, 0.0, 0.9) * (zoom - 1) * height)
+        shift_x = torch.trunc(self.uniform(n, -1, 1) * self.max_translation[0] * width)
+        shift_y = torch.trunc(self.uniform(n, -1, 1) * self.max_translation[1] * height)
+
+        # pixel x of the output comes from a*x + b of the input, likewise for y
+        sign = 1.0 - 2.0 * flip.float()
+        a_x = sign / zoom
+        b_x = (crop_x + shift_x) * a_x + flip.float() * (width - 1)
+        a_y = 1.0 / zoom
+        b_y = (crop_y + shift_y) * a_y
+
+        # the same transform in grid_sample's [-1,1] coordinates
+        theta = torch.zeros((n, 2, 3))
+        theta[:,0,0] = a_x
+        theta[:,0,2] = a_x - (a_x - 2*b_x - 1) / width - 1
+        theta[:,1,1] = a_y
+        theta[:,1,2] = a_y - (a_y - 2*b_y - 1) / height - 1
+        theta = theta.to(imgs.device)
+        grid = F.affine_grid(theta, (n, 3, height, width), align_corners=False)
+        imgs = F.grid_sample(imgs, grid, mode='bilinear', padding_mode='zeros', align_corners=False)
+
+        # move the boxes with the inverse transform, keeping x0 < x1 when flipped
+        if(counts is None):
+            index = torch.arange(n)[:,None]
+        else:
+            index = torch.repeat_interleave(torch.arange(n), torch.as_tensor(counts, dtype=torch.int64))
+        a_x, b_x, a_y, b_y = [v[index][...,None].to(boxes.device) for v in [a_x, b_x, a_y, b_y]]
+        dtype = boxes.dtype
+        boxes = boxes.float()
+        x = (boxes[...,[0,2]] - b_x) / a_x
+        y = (boxes[...,[1,3]] - b_y) / a_y
+        x = torch.sort(x, dim=-1)[0].clamp(0, width-1)
+        y = y.clamp(0, height-1)
+        boxes = torch.stack((x[...,0], y[...,0], x[...,1], y[...,1]), dim=-1).round()
+
+        # boxes that moved out of the image are no longer labeled
+        invalid = torch.logical_or(boxes[...,2] - boxes[...,0] < 0.5, boxes[...,3] - boxes[...,1] < 0.5)
+        labels = labels.masked_fill(invalid, 0)
+        boxes = torch.where(invalid[...,None], torch.tensor([0., 0., 1., 1.], device=boxes.device), boxes)
+        return imgs, boxes.to(dtype), labels
+
+    def color(self, imgs):
+        # brightness, sharpness, saturation and contrast like PIL's ImageEnhance, blending
+        # each image with a degenerate version of itself. Works in place on imgs
+        n = imgs.shape[0]
+        device = imgs.device
+
+        def factor(limits):
+            return self.uniform(n, limits[0], limits[1]).to(device)[:,None,None,None]
+
+        def grayscale(imgs):
+            return torch.einsum('bchw,c->bhw', imgs, self.gray.to(device))[:,None]
+
+        imgs.mul_(factor(self.brightness)).clamp_(0.0, 1.0)
+
+        # PIL's smoothing kernel is a 3x3 box sum with 4 more times the center, summed
+        # separably. The border is left unsmoothed like in PIL
+        center = imgs[:,:,1:-1,1:-1]
+        rows = imgs[:,:,:,:-2] + imgs[:,:,:,1:-1]
+        rows += imgs[:,:,:,2:]
+        smooth = rows[:,:,:-2] + rows[:,:,1:-1]
+        smooth += rows[:,:,2:]
+        smooth.add_(center, alpha=4.0).div_(13.0)
+        center.copy_(torch.lerp(smooth, center, factor(self.sharpness)).clamp_(0.0, 1.0))
+
+        imgs.lerp_(grayscale(imgs).expand_as(imgs), 1.0 - factor(self.saturation)).clamp_(0.0, 1.0)
+
+        mean = grayscale(imgs).mean(dim=(2,3), keepdim=True)
+        imgs.lerp_(mean.expand_as(imgs), 1.0 - factor(self.contrast)).clamp_(0.0, 1.0)
+        return imgs
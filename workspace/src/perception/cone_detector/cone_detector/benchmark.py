@@ -0,0 +1,552 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import time
+import tracemalloc
+import array
+import argparse
+import types
+import sys
+import os
+import json
+import glob
+
+import numpy as np
+import torch
+
+from preprocessing import ImagePreprocessor
+from camera_model import CameraModel
+from ground_projection import GroundProjector
+from cone_tracker import ConeTracker
+from metrics import box_iou
+from cpu_profile import CpuProfile
+
+# the preprocessing used by ObjectRecognitionNode.image_callback before the ImagePreprocessor
+def legacy_preprocess(msg, device):
+    h = msg.height
+    w = msg.width
+    x = np.asarray(msg.data).reshape(
+        h, w, -1).astype(np.float32) / 255.0
+
+    if msg.encoding == "bgr8":
+        x = np.flip(x[:,:,0:3],axis=2).copy()
+
+    if torch.cuda.is_available():
+        return torch.from_numpy(x.transpose(2, 0, 1)[0:3, :, :]).half().to(device)
+    return torch.from_numpy(x.transpose(2, 0, 1)[0:3, :, :]).to(device)
+
+# the per-box projection used by ObjectRecognitionNode.pub_callback before the GroundProjector
+def legacy_direction_to_pixel(camera_params, px):
+    img_w = camera_params["width"]
+    img_h = camera_params["height"]
+    img_fov = camera_params["FOV"]
+
+    pt_x = -((px[0]+.5) / img_w * 2 - 1)
+    pt_y = -((px[1]+.5) / img_h * 2 - 1)
+    pt_y *= img_h / img_w
+
+    h_factor = img_fov / np.pi * 2.0
+
+    direction = np.array([1,pt_x*h_factor,pt_y*h_factor])
+    return direction / np.linalg.norm(direction)
+
+def legacy_position_from_box(camera_params, rectangle):
+    top_px = np.array([.5*(rectangle[0] + rectangle[2]),rectangle[1]])
+    bottom_px = np.array([.5*(rectangle[0] + rectangle[2]),rectangle[3]])
+
+    r1 = legacy_direction_to_pixel(camera_params, top_px)
+    r2 = legacy_direction_to_pixel(camera_params, bottom_px)
+
+    h = .078
+
+    l2 = h / ( r1[2]*r2[0] / r1[0] - r2[2] )
+    p2 = r2*l2
+
+    mount_pos = np.asarray(camera_params["position"])
+    mount_rot = np.asarray(camera_params["orientation"]).reshape((3,3))
+
+    return np.matmul(mount_rot,p2) + mount_pos
+
+# the per (class, instance) scan used by SegImgLoader.ConvertSegToBoxes before the single pass
+def legacy_convert_seg_to_boxes(semantic_maps):
+    boxes = []
+    labels = []
+    for c in range(1, np.max(semantic_maps[:, :, 0])+1):
+        for i in range(1, np.max(semantic_maps[:, :, 1])+1):
+            indices = np.where(
+                np.logical_and(semantic_maps[:, :, 1] == i, semantic_maps[:, :, 0] == c))
+            if(indices[0].shape[0] > 1):
+                y0 = np.min(indices[0])
+                y1 = np.max(indices[0])
+                x0 = np.min(indices[1])
+                x1 = np.max(indices[1])
+                if(x1 > x0 and y1 > y0):
+                    x_center = .5 * (x0 + x1) / float(semantic_maps.shape[1])
+                    y_center = .5 * (y0 + y1) / float(semantic_maps.shape[0])
+                    x_size = (x1-x0) / float(semantic_maps.shape[1])
+                    y_size = (y1-y0) / float(semantic_maps.shape[0])
+                    boxes.append(np.array([x_center, y_center, x_size, y_size]))
+                    labels.append(c)
+    return np.asarray(boxes), np.asarray(labels).astype(np.int32)
+
+def make_boxes(camera_params, n):
+    w = camera_params["width"]
+    h = camera_params["height"]
+    x0 = np.random.uniform(0, w-20, n)
+    y0 = np.random.uniform(h/2, h-40, n)
+    return np.stack((x0, y0, x0 + np.random.uniform(5, 20, n), y0 + np.random.uniform(10, 40, n)), axis=1)
+
+def make_image_msg(width, height, encoding):
+    channels = 4 if encoding in ["rgba8", "bgra8"] else 3
+    data = np.random.randint(0, 256, (height, width, channels), dtype=np.uint8)
+    return types.SimpleNamespace(height=height, width=width, step=width*channels,
+                                 encoding=encoding, data=array.array('B', data.tobytes()))
+
+def torch_allocated_bytes(prof):
+    # tracemalloc does not see the torch allocator, so count its allocations from the profiler
+    return sum(max(e.self_cpu_memory_usage, 0) for e in prof.events())
+
+def measure(fn, msg, frames):
+    times = []
+    numpy_bytes = []
+    torch_bytes = []
+
+    fn(msg)  # warm up any lazily allocated buffers
+    tracemalloc.start()
+    for i in range(frames):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        with torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU], profile_memory=True) as prof:
+            t0 = time.perf_counter()
+            out = fn(msg)
+            t1 = time.perf_counter()
+        times.append(t1 - t0)
+        numpy_bytes.append(tracemalloc.get_traced_memory()[1] - base)
+        torch_bytes.append(torch_allocated_bytes(prof))
+        del out
+    tracemalloc.stop()
+
+    return np.median(times), np.mean(numpy_bytes) + np.mean(torch_bytes)
+
+def preprocess(args):
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+    msg = make_image_msg(args.width, args.height, args.encoding)
+
+    preprocessor = ImagePreprocessor(device, dtype)
+
+    legacy_out = legacy_preprocess(msg, device)
+    new_out = preprocessor.process(msg)
+    print("Max abs difference between paths = {:.3e}".format((legacy_out.float() - new_out.float()).abs().max().item()))
+
+    legacy_time, legacy_bytes = measure(lambda m: legacy_preprocess(m, device), msg, args.frames)
+    new_time, new_bytes = measure(preprocessor.process, msg, args.frames)
+
+    print("Preprocessing {}x{} {} on {} over {} frames".format(args.width, args.height, args.encoding, device, args.frames))
+    print("  legacy:       {:8.3f} ms/frame, {:12.0f} bytes allocated/frame".format(1e3*legacy_time, legacy_bytes))
+    print("  preprocessor: {:8.3f} ms/frame, {:12.0f} bytes allocated/frame".format(1e3*new_time, new_bytes))
+
+def projection(args):
+    camera_params = json.load(open(args.calibration))
+
+    t0 = time.perf_counter()
+    camera_model = CameraModel(camera_params, args.cache_dir)
+    t1 = time.perf_counter()
+    print("Camera model loaded in {:.3f} ms (cache dir = {})".format(1e3*(t1-t0), args.cache_dir))
+    projector = GroundProjector(camera_model)
+    boxes = make_boxes(camera_params, args.boxes)
+
+    legacy = np.asarray([legacy_position_from_box(camera_params, b) for b in boxes])
+    vectorized = projector.project_boxes(boxes)
+    print("Max abs difference between paths = {:.3e} m".format(np.max(np.abs(legacy - vectorized))))
+
+    t0 = time.perf_counter()
+    for i in range(args.frames):
+        [legacy_position_from_box(camera_params, b) for b in boxes]
+    t1 = time.perf_counter()
+    for i in range(args.frames):
+        projector.project_boxes(boxes)
+    t2 = time.perf_counter()
+
+    print("Projecting {} boxes over {} frames".format(args.boxes, args.frames))
+    print("  legacy:     {:8.3f} ms/frame".format(1e3*(t1-t0)/args.frames))
+    print("  ray table:  {:8.3f} ms/frame".format(1e3*(t2-t1)/args.frames))
+
+def frame_recall(boxes, labels, gt_boxes, gt_labels, iou_threshold):
+    # number of labeled boxes covered by an output box of the same class
+    iou = box_iou(gt_boxes, boxes)
+    iou[gt_labels[:,None] != labels[None,:]] = 0
+    if(iou.shape[1] == 0):
+        return 0
+    return int(np.sum(np.max(iou, axis=1) >= iou_threshold))
+
+def tracking(args):
+    from recognition_network import RecognitionNetwork
+    from loader import ObjectDetectionImgLoader
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    network = RecognitionNetwork(device, pretrained_backbone=False)
+    if(args.model != ""):
+        network.load(args.model)
+    network.eval()
+
+    # the frames are a sequence, so keep them in file name order
+    dataset = ObjectDetectionImgLoader(args.data_dir, 100, max_samples=-1)
+    order = np.argsort(dataset.imgs)
+    dataset.imgs = [dataset.imgs[i] for i in order]
+    dataset.labels = [dataset.labels[i] for i in order]
+    if(args.frames > 0):
+        dataset.imgs = dataset.imgs[0:args.frames]
+        dataset.labels = dataset.labels[0:args.frames]
+    frames = [dataset[i] for i in range(len(dataset))]
+
+    print("Tracking over {} sequential frames on {}".format(len(frames), device))
+    print("  interval  detections       fps   recall")
+    for k in args.intervals:
+        tracker = ConeTracker(max_misses=k) if k > 1 else None
+        found = 0
+        total = 0
+        detections = 0
+        total_time = 0.0
+        for i, (img, gt_boxes, gt_labels) in enumerate(frames):
+            t0 = time.perf_counter()
+            if(tracker is None or i % k == 0 or tracker.confidence() < args.min_track_confidence):
+                with torch.no_grad():
+                    prediction = network.predict([torch.from_numpy(img).to(device)])[0]
+                boxes = prediction['boxes'].cpu().numpy()
+                labels = prediction['labels'].cpu().numpy()
+                scores = prediction['scores'].cpu().numpy()
+                keep = np.logical_and(scores >= args.track_min_score, labels > 0)
+                boxes, labels, scores = boxes[keep], labels[keep], scores[keep]
+                if(tracker is not None):
+                    tracks = tracker.update(boxes, labels, scores)
+                    boxes, labels = tracks['boxes'], tracks['labels']
+                detections += 1
+            else:
+                tracks = tracker.predict()
+                boxes, labels = tracks['boxes'], tracks['labels']
+            total_time += time.perf_counter() - t0
+
+            keep = gt_labels > 0
+            found += frame_recall(boxes, labels, gt_boxes[keep], gt_labels[keep], args.iou_threshold)
+            total += int(np.sum(keep))
+
+        recall = found / total if total > 0 else float('nan')
+        print("  {:8d}  {:10d}  {:8.2f}  {:7.3f}".format(k, detections, len(frames)/total_time, recall))
+
+def startup(args):
+    import tempfile
+    import shutil
+    from recognition_network import RecognitionNetwork
+    from model_cache import ModelCache
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    img = torch.rand((3,args.height,args.width), device=device)
+    cache_dir = tempfile.mkdtemp()
+    model_file = args.model
+    if(model_file == ""):
+        model_file = os.path.join(cache_dir, "random_model.pt")
+        torch.save(RecognitionNetwork("cpu", pretrained_backbone=False).model.state_dict(), model_file)
+
+    # same steps as ObjectRecognitionNode, a fresh cache the first time and a populated one the second
+    cache = ModelCache(cache_dir)
+    for name in ["cold cache", "warm cache"]:
+        t0 = time.perf_counter()
+        key = cache.key(model_file, backend="torch", precision="fp32", device=device)
+        network = RecognitionNetwork(device, build=False)
+        if(not cache.load(network, key)):
+            network = RecognitionNetwork(device, pretrained_backbone=False)
+            network.load(model_file)
+            cache.store(network, key)
+        network.eval()
+        t1 = time.perf_counter()
+        with torch.no_grad():
+            network.predict([img])
+        t2 = time.perf_counter()
+        print("{}: model ready in {:.3f} s, first detection after {:.3f} s".format(name, t1-t0, t2-t0))
+    shutil.rmtree(cache_dir)
+
+def cpu_tune(args):
+    from recognition_network import RecognitionNetwork
+
+    # pin first so the thread counts are measured on the cores the node will get
+    cores = args.cores if len(args.cores) > 0 else sorted(os.sched_getaffinity(0))
+    CpuProfile(cores=args.cores).apply()
+    max_threads = args.max_threads if args.max_threads > 0 else len(cores)
+
+    network = RecognitionNetwork("cpu", pretrained_backbone=False)
+    if(args.model != ""):
+        network.load(args.model)
+    network.eval()
+    img = torch.rand((3,args.height,args.width))
+
+    def time_frames(threads):
+        torch.set_num_threads(threads)
+        times = []
+        for i in range(args.warmup + args.frames):
+            t0 = time.perf_counter()
+            network.predict([img])
+            if(i >= args.warmup):
+                times.append(time.perf_counter() - t0)
+        return float(np.median(times))
+
+    thread_counts = sorted(set([t for t in [1, 2, 3, 4, 6, 8, 12, 16, 24, 32] if t < max_threads] + [max_threads]))
+    results = []
+    print("Tuning {}x{} inference on cores {}".format(args.width, args.height, cores))
+    # reference only, the node always runs under one of the grad modes below
+    print("Autograd enabled, contiguous, {} threads: {:.2f} ms/frame".format(max_threads, 1e3*time_frames(max_threads)))
+    print("  threads  channels_last  inference_mode  ms/frame")
+    for channels_last in [False, True]:
+        for inference_mode in [False, True]:
+            profile = CpuProfile(channels_last=channels_last, inference_mode=inference_mode, cores=args.cores)
+            network.model = profile.prepare(network.model)
+            for threads in thread_counts:
+                with profile.context():
+                    latency = time_frames(threads)
+                results.append((latency, threads, channels_last, inference_mode))
+                print("  {:7d}  {:13}  {:14}  {:8.2f}".format(threads, str(channels_last), str(inference_mode), 1e3*latency))
+
+    # the fewest threads within tolerance of the fastest configuration, the cores are
+    # shared with planning and control. The inter-op thread count is not tuned, torch fixes
+    # it at the first parallel work of a process
+    best = min(r[0] for r in results)
+    latency, threads, channels_last, inference_mode = min([r for r in results if r[0] <= best * (1 + args.thread_tolerance)], key=lambda r: (r[1], r[0]))
+    profile = CpuProfile(threads=threads, interop_threads=args.interop_threads, channels_last=channels_last, inference_mode=inference_mode, cores=args.cores)
+    profile.to_file(args.profile_output)
+    print("Selected {} at {:.2f} ms/frame (fastest {:.2f} ms/frame), written to {}".format(profile.to_dict(), 1e3*latency, 1e3*best, args.profile_output))
+
+def seg_boxes(args):
+    from PIL import Image
+    from loader import SegImgLoader
+
+    seg_dir = args.seg_dir if args.seg_dir != "" else os.path.join(args.data_dir, "seg_imgs")
+    files = sorted(glob.glob(os.path.join(seg_dir, "*.png")))
+    if(args.frames > 0):
+        files = files[0:args.frames]
+    if(len(files) == 0):
+        print("Error: no segmentation images found in {}".format(seg_dir))
+        exit(1)
+    seg_imgs = [np.array(Image.open(f)).view(np.uint16) for f in files]
+
+    # the conversion does not depend on the loader's files
+    loader = SegImgLoader.__new__(SegImgLoader)
+
+    legacy_time = 0
+    new_time = 0
+    num_boxes = 0
+    for f, seg_img in zip(files, seg_imgs):
+        t0 = time.perf_counter()
+        legacy_boxes, legacy_labels = legacy_convert_seg_to_boxes(seg_img)
+        t1 = time.perf_counter()
+        boxes, labels = loader.ConvertSegToBoxes(seg_img)
+        t2 = time.perf_counter()
+        legacy_time += t1 - t0
+        new_time += t2 - t1
+        num_boxes += labels.shape[0]
+
+        if(not (np.array_equal(legacy_boxes, boxes) and np.array_equal(legacy_labels, labels)
+                and legacy_boxes.dtype == boxes.dtype and legacy_boxes.shape == boxes.shape)):
+            print("Error: boxes differ from the legacy conversion for {}".format(f))
+            exit(1)
+
+    print("Converted {} segmentation images with {} boxes, outputs identical".format(len(files), num_boxes))
+    print("  legacy:      {:8.3f} ms/image".format(1e3*legacy_time/len(files)))
+    print("  single pass: {:8.3f} ms/image".format(1e3*new_time/len(files)))
+
+def loading(args):
+    from loader import ObjectDetectionImgLoader, PackedDetectionLoader, collate_detections
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    datasets = [("png", ObjectDetectionImgLoader)]
+    if(os.path.exists(os.path.join(args.data_dir, "packed", "index.json"))):
+        datasets.append(("packed", PackedDetectionLoader))
+    else:
+        print("No packed dataset in {}, run train.py --mode pack to compare".format(args.data_dir))
+
+    print("Loading with batch size {} and {} workers to {}".format(args.batch_size, args.workers, device))
+    print("  dataset  batches                   imgs/s   bytes/step")
+    for name, dataset_type in datasets:
+        # padded float32 samples moved one sample at a time, against ragged uint8 batches
+        # moved with one pinned copy each for the images and the targets
+        padded = dataset_type(args.data_dir, 100, max_samples=args.frames)
+        ragged = dataset_type(args.data_dir, 100, max_samples=args.frames, uint8_images=True, ragged=True)
+        loaders = [("padded float32", torch.utils.data.DataLoader(padded, args.batch_size, num_workers=args.workers,
+                                                                  pin_memory=torch.cuda.is_available())),
+                   ("ragged uint8", torch.utils.data.DataLoader(ragged, args.batch_size, num_workers=args.workers,
+                                                                collate_fn=collate_detections, pin_memory=torch.cuda.is_available()))]
+        for batches, loader in loaders:
+            t0 = time.perf_counter()
+            samples = 0
+            total_bytes = 0
+            steps = 0
+            for data in loader:
+                if(batches == "padded float32"):
+                    imgs, boxes, labels = data
+                    for b in range(imgs.shape[0]):
+                        ids = labels[b, :] > 0
+                        imgs[b].to(device)
+                        boxes[b, ids, :].to(device)
+                        labels[b, ids].to(device)
+                    total_bytes += sum(t.nelement() * t.element_size() for t in data)
+                else:
+                    data.to(device)
+                    imgs = data.imgs
+                    total_bytes += data.nbytes()
+                if(device == "cuda"):
+                    torch.cuda.synchronize()
+                samples += imgs.shape[0]
+                steps += 1
+            t1 = time.perf_counter()
+            print("  {:7}  {:16}  {:12.1f}  {:11.0f}".format(name, batches, samples/(t1-t0), total_bytes/steps))
+
+def augmentation(args):
+    from augmentation import BatchAugmentation
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    augment = BatchAugmentation(seed=0)
+    imgs = torch.randint(0, 256, (args.batch_size, 3, args.height, args.width), dtype=torch.uint8)
+    boxes = torch.from_numpy(np.tile(make_boxes({"width": args.width, "height": args.height}, args.boxes), (args.batch_size,1,1))).int()
+    labels = torch.ones((args.batch_size, args.boxes), dtype=torch.int64)
+
+    max_threads = args.max_threads if args.max_threads > 0 else torch.get_num_threads()
+    print("Augmenting batches of {} {}x{} images on {}".format(args.batch_size, args.width, args.height, device))
+    print("  threads    imgs/s")
+    for threads in sorted(set([1, 2, 4, 8, 16, max_threads])):
+        if(threads > max_threads):
+            continue
+        torch.set_num_threads(threads)
+        augment(imgs.to(device), boxes, labels)
+        t0 = time.perf_counter()
+        for i in range(args.frames):
+            out = augment(imgs.to(device), boxes, labels)
+        if(device == "cuda"):
+            torch.cuda.synchronize()
+        t1 = time.perf_counter()
+        print("  {:7d}  {:8.1f}".format(threads, args.frames*args.batch_size/(t1-t0)))
+
+def main(args):
+    if(args.mode == "preprocess"):
+        preprocess(args)
+    elif(args.mode == "projection"):
+        projection(args)
+    elif(args.mode == "tracking"):
+        tracking(args)
+    elif(args.mode == "startup"):
+        startup(args)
+    elif(args.mode == "cpu_tune"):
+        cpu_tune(args)
+    elif(args.mode == "seg_boxes"):
+        seg_boxes(args)
+    elif(args.mode == "loading"):
+        loading(args)
+    elif(args.mode == "augmentation"):
+        augmentation(args)
+
+def parseargs():
+
+    # === DEFAULTS === #
+    width = 1280
+    height = 720
+    encoding = "bgr8"
+    frames = 100
+    boxes = 100
+    calibration = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "calibration.json")
+    cache_dir = os.path.join("~", ".cache", "cone_detector")
+    data_dir = os.path.join("..", "data", "val")
+    intervals = [1, 2, 3, 5]
+
+    parser = argparse.ArgumentParser(description='Cone Detector Benchmarks.')
+
+    # general mode
+    parser.add_argument('--mode', default="preprocess",
+                        choices=["preprocess", "projection", "tracking", "startup", "cpu_tune", "seg_boxes", "loading", "augmentation"], help='benchmark to run')
+
+    # image parameters
+    parser.add_argument('--width', type=int, default=width,
+                        help="image width in pixels")
+    parser.add_argument('--height', type=int, default=height,
+                        help="image height in pixels")
+    parser.add_argument('--encoding', type=str, default=encoding,
+                        choices=["rgb8", "bgr8", "rgba8", "bgra8"], help="image encoding")
+    parser.add_argument('--frames', type=int, default=frames,
+                        help="number of frames to time")
+
+    # projection parameters
+    parser.add_argument('--boxes', type=int, default=boxes,
+                        help="number of detections per frame")
+    parser.add_argument('--calibration', type=str, default=calibration,
+                        help="camera calibration file")
+    parser.add_argument('--cache_dir', type=str, default=cache_dir,
+                        help="directory for cached camera ray tables, empty to disable caching")
+
+    # tracking parameters
+    parser.add_argument('--data_dir', type=str, default=data_dir,
+                        help="folder of sequential frames with imgs/ and labels/")
+    parser.add_argument('--model', type=str, default="",
+                        help="model weights, randomly initialized weights are used for startup if empty")
+    parser.add_argument('--intervals', type=int, nargs='+', default=intervals,
+                        help="detector intervals to compare, 1 runs the detector on every frame")
+    parser.add_argument('--min_track_confidence', type=float, default=0.3,
+                        help="run the detector when a track's confidence drops below this")
+    parser.add_argument('--track_min_score', type=float, default=0.5,
+                        help="minimum score of the detections that are tracked")
+    parser.add_argument('--iou_threshold', type=float, default=0.5,
+                        help="iou for a labeled box to count as found")
+
+    # cpu tuning parameters
+    parser.add_argument('--cores', type=int, nargs='*', default=[],
+                        help="cores to pin inference to, all available cores if empty")
+    parser.add_argument('--max_threads', type=int, default=0,
+                        help="largest intra-op thread count to try, the number of cores if 0")
+    parser.add_argument('--warmup', type=int, default=3,
+                        help="untimed runs per configuration")
+    parser.add_argument('--thread_tolerance', type=float, default=0.05,
+                        help="relative slowdown accepted for using fewer threads")
+    parser.add_argument('--interop_threads', type=int, default=1,
+                        help="inter-op thread count written to the profile, not tuned")
+    parser.add_argument('--profile_output', type=str, default="cpu_profile.json",
+                        help="file the selected cpu profile is written to")
+
+    # segmentation box parameters
+    parser.add_argument('--seg_dir', type=str, default="",
+                        help="folder of segmentation pngs, <data_dir>/seg_imgs if empty")
+
+    # loading parameters
+    parser.add_argument('--batch_size', type=int, default=12,
+                        help="samples per batch")
+    parser.add_argument('--workers', type=int, default=12,
+                        help="data loader worker processes")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parseargs()
+    main(args)
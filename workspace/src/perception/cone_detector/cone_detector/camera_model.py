@@ -0,0 +1,114 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+import hashlib
+import json
+import os
+
+# camera model built from a calibration file (see data/calibration.json). The ray
+# through every pixel is computed once and stored in a table that is cached on disk
+# as a .npy file, keyed by a hash of the calibration, and memory mapped on later loads.
+# Models with lens distortion should subclass this and override compute_rays, the
+# table, cache and lookups are unchanged for callers.
+class CameraModel():
+    def __init__(self, camera_params, cache_dir=None):
+        self.params = camera_params
+        self.width = int(camera_params["width"])
+        self.height = int(camera_params["height"])
+        self.fov = camera_params["FOV"]
+
+        # mount transform from camera to vehicle frame
+        self.position = np.asarray(camera_params["position"], dtype=np.float64)
+        self.rotation = np.asarray(camera_params["orientation"], dtype=np.float64).reshape((3,3))
+
+        self.cache_dir = cache_dir
+        self.rays = self.load_ray_table()
+
+    @classmethod
+    def from_file(cls, calibration_file, cache_dir=None):
+        return cls(json.load(open(calibration_file)), cache_dir)
+
+    def key(self):
+        contents = json.dumps(self.params, sort_keys=True) + type(self).__name__
+        return hashlib.sha256(contents.encode()).hexdigest()[0:16]
+
+    def compute_rays(self, u, v):
+        # unit rays in the camera frame (x forward, y left, z up) for arrays of pixel coordinates
+        h_factor = self.fov / np.pi * 2.0
+
+        rays = np.empty(np.shape(u) + (3,))
+        rays[...,0] = 1
+        rays[...,1] = -((u+.5) / self.width * 2 - 1) * h_factor # -1 to 1
+        rays[...,2] = -((v+.5) / self.height * 2 - 1) * self.height / self.width * h_factor # flipped so -1 is bottom of image
+        rays /= np.linalg.norm(rays, axis=-1, keepdims=True)
+        return rays
+
+    def build_ray_table(self):
+        v, u = np.meshgrid(np.arange(self.height, dtype=np.float64), np.arange(self.width, dtype=np.float64), indexing='ij')
+        return self.compute_rays(u, v).astype(np.float32)
+
+    def load_ray_table(self):
+        if(self.cache_dir is None or self.cache_dir == ""):
+            return self.build_ray_table()
+
+        cache_dir = os.path.expanduser(self.cache_dir)
+        if(not os.path.exists(cache_dir)):
+            os.makedirs(cache_dir, exist_ok=True)
+
+        path = os.path.join(cache_dir, "rays_{}.npy".format(self.key()))
+        if(not os.path.exists(path)):
+            # write to a temporary file first so concurrent readers never see a partial table
+            tmp_path = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp_path, "wb") as f:
+                np.save(f, self.build_ray_table())
+            os.replace(tmp_path, path)
+
+        return np.load(path, mmap_mode='r')
+
+    def lookup(self, px):
+        # rays for an (N,2) array of pixel coordinates. Coordinates are bilinearly
+        # interpolated between table entries and clamped to the image
+        px = np.asarray(px, dtype=np.float64).reshape((-1,2))
+        u = np.clip(px[:,0], 0, self.width - 1)
+        v = np.clip(px[:,1], 0, self.height - 1)
+
+        u0 = np.minimum(np.floor(u).astype(np.int64), self.width - 2)
+        v0 = np.minimum(np.floor(v).astype(np.int64), self.height - 2)
+        fu = (u - u0)[:,None]
+        fv = (v - v0)[:,None]
+
+        rays = (self.rays[v0,u0] * (1-fu) * (1-fv) + self.rays[v0,u0+1] * fu * (1-fv)
+                + self.rays[v0+1,u0] * (1-fu) * fv + self.rays[v0+1,u0+1] * fu * fv)
+        return rays / np.linalg.norm(rays, axis=1, keepdims=True)
+
+    def to_vehicle(self, points):
+        # (N,3) points in the camera frame -> (N,3) points in the vehicle frame
+        return np.matmul(points, self.rotation.T) + self.position
@@ -0,0 +1,168 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+import uuid
+
+from metrics import box_iou
+
+# tracks cone boxes between detector runs with a constant velocity kalman filter per
+# cone. The state of every track is [cx, cy, w, h, vx, vy, vw, vh] in pixels (per
+# frame), and all tracks are predicted and updated together as arrays. A detection frame
+# is the truth: tracks it does not confirm are dropped, so only cones seen in the last
+# detection frame coast until the next one.
+class ConeTracker():
+    def __init__(self, iou_threshold=0.3, max_misses=10, confidence_decay=0.9,
+                 process_noise=1.0, measurement_noise=4.0):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.confidence_decay = confidence_decay
+
+        # constant velocity model
+        self.F = np.eye(8)
+        self.F[0:4,4:8] = np.eye(4)
+        self.H = np.eye(4, 8)
+        self.Q = np.diag([1, 1, 1, 1, .1, .1, .1, .1]) * process_noise
+        self.R = np.eye(4) * measurement_noise
+
+        self.x = np.zeros((0,8))     # track states
+        self.P = np.zeros((0,8,8))   # track covariances
+        self.labels = np.zeros((0), dtype=np.int64)
+        self.scores = np.zeros((0))  # score of the last detection
+        self.misses = np.zeros((0), dtype=np.int64)  # frames since the last detection
+        self.ids = np.zeros((0,16), dtype=np.uint8)  # uuid of each track
+
+    def __len__(self):
+        return self.x.shape[0]
+
+    def boxes(self):
+        cx, cy, w, h = self.x[:,0], self.x[:,1], self.x[:,2], self.x[:,3]
+        return np.stack((cx - w/2, cy - h/2, cx + w/2, cy + h/2), axis=1)
+
+    def confidences(self):
+        return self.scores * self.confidence_decay**self.misses
+
+    def confidence(self):
+        # lowest confidence over the tracks, 0 without tracks so the detector gets run. All
+        # tracks were matched in the last detection frame, so a cone that left the view no
+        # longer holds the confidence down
+        if(len(self) == 0):
+            return 0.0
+        return float(np.min(self.confidences()))
+
+    def tracks(self):
+        return {'boxes': self.boxes(), 'labels': self.labels.copy(), 'scores': self.confidences(), 'ids': self.ids.copy()}
+
+    def predict(self):
+        # advance all tracks one frame without a detection and return them
+        self.x = np.matmul(self.x, self.F.T)
+        self.P = np.matmul(np.matmul(self.F, self.P), self.F.T) + self.Q
+        # keep boxes from collapsing
+        self.x[:,2:4] = np.maximum(self.x[:,2:4], 1.0)
+        self.misses += 1
+        self.prune()
+        return self.tracks()
+
+    def update(self, boxes, labels, scores):
+        # advance all tracks one frame and correct them with a detection of the frame
+        boxes = np.asarray(boxes, dtype=np.float64).reshape((-1,4))
+        labels = np.asarray(labels, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.float64)
+
+        self.predict()
+
+        # greedy matching on iou between tracks and detections of the same label
+        iou = box_iou(self.boxes(), boxes)
+        iou[self.labels[:,None] != labels[None,:]] = 0
+        track_ids = []
+        detection_ids = []
+        while(iou.size > 0):
+            t, d = np.unravel_index(np.argmax(iou), iou.shape)
+            if(iou[t,d] < self.iou_threshold):
+                break
+            track_ids.append(t)
+            detection_ids.append(d)
+            iou[t,:] = -1
+            iou[:,d] = -1
+
+        # tracks the detection frame does not confirm are dropped instead of coasting on
+        # as phantom cones
+        matched = np.zeros(len(self), dtype=bool)
+        matched[np.asarray(track_ids, dtype=np.int64)] = True
+
+        if(len(track_ids) > 0):
+            t = np.asarray(track_ids)
+            z = self.measurement(boxes[detection_ids])
+
+            # kalman update for the matched tracks
+            P = self.P[t]
+            S = np.matmul(np.matmul(self.H, P), self.H.T) + self.R
+            K = np.matmul(np.matmul(P, self.H.T), np.linalg.inv(S))
+            y = z - np.matmul(self.x[t], self.H.T)
+            self.x[t] = self.x[t] + np.matmul(K, y[:,:,None])[:,:,0]
+            self.P[t] = np.matmul(np.eye(8) - np.matmul(K, self.H), P)
+
+            self.scores[t] = scores[detection_ids]
+            self.misses[t] = 0
+        self.keep(matched)
+
+        # start tracks for unmatched detections
+        new = np.setdiff1d(np.arange(boxes.shape[0]), np.asarray(detection_ids, dtype=np.int64))
+        if(len(new) > 0):
+            x = np.zeros((len(new),8))
+            x[:,0:4] = self.measurement(boxes[new])
+            P = np.tile(np.diag([10, 10, 10, 10, 100, 100, 100, 100]).astype(np.float64), (len(new),1,1))
+            ids = np.asarray([np.frombuffer(uuid.uuid4().bytes, dtype=np.uint8) for i in new])
+
+            self.x = np.concatenate((self.x, x))
+            self.P = np.concatenate((self.P, P))
+            self.labels = np.concatenate((self.labels, labels[new]))
+            self.scores = np.concatenate((self.scores, scores[new]))
+            self.misses = np.concatenate((self.misses, np.zeros(len(new), dtype=np.int64)))
+            self.ids = np.concatenate((self.ids, ids))
+
+        return self.tracks()
+
+    def measurement(self, boxes):
+        return np.stack((.5*(boxes[:,0] + boxes[:,2]), .5*(boxes[:,1] + boxes[:,3]),
+                         boxes[:,2] - boxes[:,0], boxes[:,3] - boxes[:,1]), axis=1)
+
+    def prune(self):
+        self.keep(self.misses <= self.max_misses)
+
+    def keep(self, keep):
+        if(np.all(keep)):
+            return
+        self.x = self.x[keep]
+        self.P = self.P[keep]
+        self.labels = self.labels[keep]
+        self.scores = self.scores[keep]
+        self.misses = self.misses[keep]
+        self.ids = self.ids[keep]
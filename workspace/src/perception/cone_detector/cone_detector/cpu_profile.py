@@ -0,0 +1,87 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import json
+import os
+
+import torch
+
+# execution settings for running the detector on the cpu. Profiles are written by
+# benchmark.py --mode cpu_tune and loaded by ObjectRecognitionNode with the cpu_profile
+# parameter. cpu_tune times the intra-op thread count, the memory format and the grad mode
+# on the given cores; the inter-op thread count is set by its --interop_threads argument.
+# A thread count of 0 keeps the torch default, an empty core list keeps the affinity of
+# the process.
+class CpuProfile():
+    def __init__(self, threads=0, interop_threads=0, channels_last=False, inference_mode=True, cores=None):
+        self.threads = int(threads)
+        self.interop_threads = int(interop_threads)
+        self.channels_last = bool(channels_last)
+        self.inference_mode = bool(inference_mode)
+        self.cores = [int(c) for c in cores] if cores is not None else []
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(**json.load(open(os.path.expanduser(path))))
+
+    def to_file(self, path):
+        with open(os.path.expanduser(path), "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def to_dict(self):
+        return {
+            'threads': self.threads,
+            'interop_threads': self.interop_threads,
+            'channels_last': self.channels_last,
+            'inference_mode': self.inference_mode,
+            'cores': self.cores,
+        }
+
+    def apply(self):
+        # process wide settings, call before any inference. Threads started afterwards,
+        # including torch's own pools, inherit the core affinity
+        if(len(self.cores) > 0):
+            os.sched_setaffinity(0, self.cores)
+        if(self.threads > 0):
+            torch.set_num_threads(self.threads)
+        if(self.interop_threads > 0):
+            # torch only allows this before the first inter-op parallel work
+            torch.set_num_interop_threads(self.interop_threads)
+
+    def prepare(self, model):
+        # memory format of the conv weights, activations follow the weights
+        memory_format = torch.channels_last if self.channels_last else torch.contiguous_format
+        return model.to(memory_format=memory_format)
+
+    def context(self):
+        # grad mode to run inference under
+        if(self.inference_mode):
+            return torch.inference_mode()
+        return torch.no_grad()
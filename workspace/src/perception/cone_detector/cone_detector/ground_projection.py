@@ -0,0 +1,51 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+
+# projects detected boxes to cone positions in the vehicle frame, using the known
+# cone height to recover the distance along the ray through the bottom of the box
+class GroundProjector():
+    def __init__(self, camera_model, cone_height=.078):
+        self.camera_model = camera_model
+        self.cone_height = cone_height
+
+    def project_boxes(self, boxes):
+        # (N,4) boxes as x0,y0,x1,y1 in pixels -> (N,3) positions of the cone base in the vehicle frame
+        boxes = np.asarray(boxes, dtype=np.float64).reshape((-1,4))
+        center_x = .5*(boxes[:,0] + boxes[:,2])
+
+        r1 = self.camera_model.lookup(np.stack((center_x, boxes[:,1]), axis=1)) # top of cone
+        r2 = self.camera_model.lookup(np.stack((center_x, boxes[:,3]), axis=1)) # bottom of cone
+
+        l2 = self.cone_height / (r1[:,2]*r2[:,0] / r1[:,0] - r2[:,2])
+        p2 = r2 * l2[:,None]
+
+        return self.camera_model.to_vehicle(p2)
@@ -0,0 +1,92 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import torch
+import numpy as np
+
+# inference backends run the detector on a list of (3,h,w) float tensors and return a
+# list with a dict of 'boxes', 'labels' and 'scores' tensors per image, like torchvision
+class InferenceBackend():
+    # whether set_input_size can change the input size after the model is loaded
+    supports_dynamic_size = False
+
+    def predict(self, imgs):
+        raise NotImplementedError
+
+    def set_input_size(self, w, h):
+        # size the network resizes every image to before running the backbone
+        raise NotImplementedError
+
+    def eval(self):
+        pass
+
+# runs a RecognitionNetwork in pytorch
+class TorchBackend(InferenceBackend):
+    supports_dynamic_size = True
+
+    def __init__(self, network):
+        self.network = network
+
+    def predict(self, imgs):
+        return self.network.predict(imgs)
+
+    def set_input_size(self, w, h):
+        self.network.set_input_size(w, h)
+
+    def eval(self):
+        self.network.eval()
+
+# runs a model exported with RecognitionNetwork.export through onnx runtime on the cpu. The
+# input size is fixed when the model is exported (--export_width/--export_height)
+class OnnxRuntimeBackend(InferenceBackend):
+    def __init__(self, path, threads=0):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if(threads > 0):
+            options.intra_op_num_threads = threads
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_names = [o.name for o in self.session.get_outputs()]
+
+    def predict(self, imgs):
+        # the exported graph takes a single image, so batches are run one image at a time
+        predictions = []
+        for img in imgs:
+            x = np.ascontiguousarray(img.detach().cpu().float().numpy())
+            outputs = dict(zip(self.output_names, self.session.run(None, {self.input_name: x})))
+            prediction = {}
+            prediction['boxes'] = torch.from_numpy(outputs['boxes'])
+            prediction['labels'] = torch.from_numpy(outputs['labels'])
+            prediction['scores'] = torch.from_numpy(outputs['scores'])
+            predictions.append(prediction)
+        return predictions
@@ -0,0 +1,151 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import threading
+import time
+
+# mailbox with one slot per camera where a new frame overwrites any frame from
+# the same camera that has not been taken yet
+class LatestFrameMailbox():
+    def __init__(self, num_slots=1, stamp=None):
+        self.condition = threading.Condition()
+        self.frames = [None] * num_slots
+        self.closed = False
+
+        # function returning the capture time of a frame in seconds, used to group frames into batches
+        self.stamp = stamp
+
+        # counters
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame, slot=0):
+        with self.condition:
+            if(self.frames[slot] is not None):
+                self.dropped += 1
+            self.frames[slot] = frame
+            self.received += 1
+            self.condition.notify()
+
+    def pending(self):
+        return [i for i, f in enumerate(self.frames) if f is not None]
+
+    def take(self, timeout=None, gather_time=0.0, tolerance=None):
+        # blocks until a frame is available and returns a list of (slot, frame) pairs.
+        # After the first frame arrives, waits up to gather_time for the other slots to
+        # fill. Frames older than the newest frame by more than tolerance are superseded
+        # and dropped, so no frame is run after a newer one. Returns an empty list on
+        # timeout or when closed
+        with self.condition:
+            if(len(self.pending()) == 0 and not self.closed):
+                self.condition.wait(timeout)
+            if(len(self.pending()) == 0):
+                return []
+
+            deadline = time.time() + gather_time
+            while(len(self.pending()) < len(self.frames) and not self.closed):
+                remaining = deadline - time.time()
+                if(remaining <= 0):
+                    break
+                self.condition.wait(remaining)
+
+            slots = self.pending()
+            if(tolerance is not None and self.stamp is not None and len(slots) > 1):
+                newest = max(self.stamp(self.frames[i]) for i in slots)
+                stale = [i for i in slots if newest - self.stamp(self.frames[i]) > tolerance]
+                for i in stale:
+                    self.frames[i] = None
+                self.dropped += len(stale)
+                slots = [i for i in slots if i not in stale]
+
+            batch = [(i, self.frames[i]) for i in slots]
+            for i in slots:
+                self.frames[i] = None
+            return batch
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+# runs a processing function on batches of the newest frames from a mailbox in its own thread.
+# The function returns how many frames of the batch it ran inference on, the other frames
+# count as tracked. None means all of them
+class InferenceWorker(threading.Thread):
+    def __init__(self, mailbox, process, on_error=None, gather_time=0.0, tolerance=None):
+        super().__init__(name="inference_worker", daemon=True)
+        self.mailbox = mailbox
+        self.process = process
+        self.on_error = on_error
+        self.gather_time = gather_time
+        self.tolerance = tolerance
+        self.running = True
+
+        # counters
+        self.inferred = 0
+        self.tracked = 0
+        self.batches = 0
+        self.busy_time = 0.0
+
+    def run(self):
+        while(self.running):
+            batch = self.mailbox.take(timeout=0.5, gather_time=self.gather_time, tolerance=self.tolerance)
+            if(len(batch) == 0):
+                continue
+
+            t0 = time.time()
+            inferred = 0
+            try:
+                inferred = self.process(batch)
+                if(inferred is None):
+                    inferred = len(batch)
+                self.tracked += len(batch) - inferred
+            except Exception as e:
+                if(self.on_error is None):
+                    raise
+                self.on_error(e)
+            self.busy_time += time.time() - t0
+            if(inferred > 0):
+                self.inferred += inferred
+                self.batches += 1
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        self.mailbox.close()
+        self.join(timeout)
+
+    def counters(self):
+        return {
+            "frames_received": self.mailbox.received,
+            "frames_dropped": self.mailbox.dropped,
+            "frames_inferred": self.inferred,
+            "frames_tracked": self.tracked,
+            "batches_inferred": self.batches,
+        }
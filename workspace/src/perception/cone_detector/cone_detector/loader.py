@@ -37,6 +37,8 @@ import torchvision.transforms as transforms
 import time
 import os
 import glob
+import json
+import multiprocessing
 import numpy as np
 from PIL import Image, ImageEnhance, ImageFilter
 import matplotlib.pyplot as plt
@@ -78,76 +80,130 @@ class SegImgLoader():
         print("Data loaded. Imgs={}, Seg Imgs={}".format(
             len(self.imgs), len(self.seg_imgs)))
 
-    def ConvertSegToBoxes(self, semantic_maps):
-        # boxes = np.asarray(
-        #     [0, 0, 1, 1]*self.max_boxes).reshape((self.max_boxes, 4))
-        # labels = np.zeros(self.max_boxes).reshape(
-        #     (self.max_boxes)).astype(np.int64)
-
-        boxes = []
-        labels = []
-
-        box_count = 0
-
-        for c in range(1, np.max(semantic_maps[:, :, 0])+1):
-            for i in range(1, np.max(semantic_maps[:, :, 1])+1):
-                indices = np.where(
-                    np.logical_and(semantic_maps[:, :, 1] == i, semantic_maps[:, :, 0] == c))
-                if(indices[0].shape[0] > 1):
-                    y0 = np.min(indices[0])
-                    y1 = np.max(indices[0])
-                    x0 = np.min(indices[1])
-                    x1 = np.max(indices[1])
-
-                    if(x1 > x0 and y1 > y0 ):
-
-                        #change x0,y0,x1,y1 to normalized center (x,y) and width, height
-                        x_center = .5 * (x0 + x1) / float(semantic_maps.shape[1])
-                        y_center = .5 * (y0 + y1) / float(semantic_maps.shape[0])
-                        x_size = (x1-x0) /  float(semantic_maps.shape[1])
-                        y_size = (y1-y0) /  float(semantic_maps.shape[0])
-
-                        # boxes.append(np.array([x0, y0, x1, y1]))
-                        boxes.append(np.array([x_center, y_center, x_size, y_size]))
-                        labels.append(c)
-                        box_count += 1
-
-        boxes = np.asarray(boxes)#.astype(np.int32)
-        labels = np.asarray(labels).astype(np.int32)
+    @staticmethod
+    def ConvertSegToBoxes(semantic_maps):
+        # finds the box of every (class, instance) pair in a single pass: the pixels of
+        # each pair get one key, sorting groups them and the extents are reduced per key
+        h = semantic_maps.shape[0]
+        w = semantic_maps.shape[1]
+        classes = semantic_maps[:, :, 0].ravel()
+        instances = semantic_maps[:, :, 1].ravel()
+
+        pixels = np.flatnonzero(np.logical_and(classes > 0, instances > 0))
+        if(pixels.shape[0] == 0):
+            return np.asarray([]), np.asarray([]).astype(np.int32)
+
+        # ordered by class, then instance, like the boxes were always listed
+        max_instance = np.int64(np.max(instances[pixels]))
+        keys = classes[pixels].astype(np.int64) * (max_instance + 1) + instances[pixels]
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        pixels = pixels[order]
+
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        ends = np.append(starts[1:], keys.shape[0])
+
+        # pixels stay in raster order within a key, so the rows are bounded by the first and last
+        ys = pixels // w
+        xs = pixels % w
+        y0 = ys[starts]
+        y1 = ys[ends - 1]
+        x0 = np.minimum.reduceat(xs, starts)
+        x1 = np.maximum.reduceat(xs, starts)
+
+        valid = np.logical_and(ends - starts > 1, np.logical_and(x1 > x0, y1 > y0))
+        if(not np.any(valid)):
+            return np.asarray([]), np.asarray([]).astype(np.int32)
+        x0, x1, y0, y1 = x0[valid], x1[valid], y0[valid], y1[valid]
+
+        #change x0,y0,x1,y1 to normalized center (x,y) and width, height
+        boxes = np.stack((.5 * (x0 + x1) / float(w), .5 * (y0 + y1) / float(h),
+                          (x1-x0) / float(w), (y1-y0) / float(h)), axis=1)
+        labels = (keys[starts[valid]] // (max_instance + 1)).astype(np.int32)
         return boxes, labels
 
-    def GenerateAAVBBFromSeg(self,label_format=".txt"):
+    def GenerateAAVBBFromSeg(self,label_format=".txt",processes=0,regenerate=False):
         label_dir = os.path.join(self.data_root, "labels")
         if(not os.path.exists(label_dir)):
             os.mkdir(label_dir)
 
+        # only generate labels that are missing or older than one of their source images
+        work = []
         for i in range(len(self.imgs)):
-            #load segmentation img
-            seg_img = np.array(Image.open(self.seg_imgs[i])).view(np.uint16)[:, :, :]
-
-            #generate boxes and labels from segmentation img
-            boxes,classes = self.ConvertSegToBoxes(seg_img)
-
-            if(len(classes)>0):
-                classes -= np.ones(classes.shape).astype(np.int32)
-                classes = np.reshape(classes, (len(classes),1))
-                output = np.append(classes,boxes,axis=1)
-
-                basename = os.path.splitext(os.path.basename(self.imgs[i]))[0]
-                file_name = os.path.join(label_dir, basename+label_format)
-                np.savetxt(file_name,output,fmt='%.6f')
-
-                print("Generated AABB file {}/{}".format(i+1,len(self.imgs)))
-
-                
+            basename = os.path.splitext(os.path.basename(self.imgs[i]))[0]
+            file_name = os.path.join(label_dir, basename+label_format)
+            if(not regenerate and os.path.exists(file_name)):
+                label_time = os.stat(file_name).st_mtime_ns
+                if(label_time > os.stat(self.imgs[i]).st_mtime_ns and label_time > os.stat(self.seg_imgs[i]).st_mtime_ns):
+                    continue
+            work.append((self.imgs[i], self.seg_imgs[i], file_name))
+
+        print("Generating {} AABB files, {} up to date".format(len(work), len(self.imgs) - len(work)))
+        if(len(work) == 0):
+            return
+
+        processes = processes if processes > 0 else os.cpu_count()
+        processes = min(processes, len(work))
+        t0 = time.time()
+        num_boxes = 0
+        if(processes == 1):
+            for files in work:
+                num_boxes += generate_label_file(files)
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                for n in pool.imap_unordered(generate_label_file, work, chunksize=max(1, min(64, len(work) // (4*processes)))):
+                    num_boxes += n
+        t1 = time.time()
+
+        print("Generated {} AABB files with {} boxes in {:.1f} s ({:.1f} imgs/s, {} processes)".format(
+            len(work), num_boxes, t1-t0, len(work)/(t1-t0), processes))
+
+
+def generate_label_file(files):
+    # writes the label file of an (img, seg img, label) file tuple and returns the number of
+    # boxes. Not a method so pool workers are only sent the file names
+    img_file, seg_file, label_file = files
+
+    #load segmentation img
+    seg_img = np.array(Image.open(seg_file)).view(np.uint16)[:, :, :]
+
+    #generate boxes and labels from segmentation img
+    boxes,classes = SegImgLoader.ConvertSegToBoxes(seg_img)
+
+    output = np.zeros((0,5))
+    if(len(classes)>0):
+        classes -= np.ones(classes.shape).astype(np.int32)
+        classes = np.reshape(classes, (len(classes),1))
+        output = np.append(classes,boxes,axis=1)
+
+    # images without boxes get an empty file so they are not regenerated every run.
+    # Written next to the label and renamed so an interrupted run leaves no partial file
+    tmp_file = label_file + ".tmp{}".format(os.getpid())
+    np.savetxt(tmp_file,output,fmt='%.6f')
+    os.replace(tmp_file, label_file)
+    return len(classes)
+
+def load_files(files):
+    # decoded rgb image and the normalized [class, x, y, w, h] rows of an (img, label) file
+    # tuple. Not a method so pool workers are only sent the file names
+    img_file, label_file = files
+    img = np.asarray(Image.open(img_file))[:, :, 0:3]
+
+    #if the boxes file doesn't exist or is empty, it means there were no boxes in that image
+    classes_and_boxes = np.zeros((0,5))
+    if(os.path.exists(label_file) and os.path.getsize(label_file) > 0):
+        classes_and_boxes = np.loadtxt(label_file).reshape(-1,5)
+    return img, classes_and_boxes
 
 
 class ObjectDetectionImgLoader(torch.utils.data.Dataset):
-    def __init__(self, data_root, max_boxes, apply_transforms=False, max_samples=-1, img_format=".png", box_format=".txt"):
+    def __init__(self, data_root, max_boxes, apply_transforms=False, max_samples=-1, img_format=".png", box_format=".txt", uint8_images=False, ragged=False):
         self.name = "Object Detection Image Loader"
         self.data_root = data_root
         self.max_boxes = max_boxes
         self.max_samples = max_samples
+        self.uint8_images = uint8_images
+        self.ragged = ragged
 
         self.img_dir = os.path.join(self.data_root, "imgs")
         self.label_dir = os.path.join(self.data_root, "labels")
@@ -155,16 +211,7 @@ class ObjectDetectionImgLoader(torch.utils.data.Dataset):
         self.imgs = []
         self.labels = []
 
-        #transform parameters
-        self.use_transforms = apply_transforms
-        np.random.seed(1)
-        self.flip_prob = 0.5
-        self.max_translation = (0.2,0.2)
-        self.brightness = (0.75,1.33)
-        self.sharpness = (0.25,4.0)
-        self.saturation = (0.75,1.33)
-        self.contrast = (0.75,1.33)
-        self.max_zoom = 2.0
+        self.InitTransforms(apply_transforms)
 
         if(not os.path.exists(self.data_root)):
             print("Error: directory not found. Data root = {}".format(self.data_root))
@@ -200,6 +247,134 @@ class ObjectDetectionImgLoader(torch.utils.data.Dataset):
     def __len__(self):
         return len(self.imgs)
 
+    def InitTransforms(self, apply_transforms):
+        #transform parameters
+        self.use_transforms = apply_transforms
+        np.random.seed(1)
+        self.flip_prob = 0.5
+        self.max_translation = (0.2,0.2)
+        self.brightness = (0.75,1.33)
+        self.sharpness = (0.25,4.0)
+        self.saturation = (0.75,1.33)
+        self.contrast = (0.75,1.33)
+        self.max_zoom = 2.0
+
+    def LoadFiles(self, idx):
+        return load_files((self.imgs[idx], self.labels[idx]))
+
+    def Pack(self, output_dir, shard_size=512, processes=0):
+        # writes the decoded images into uint8 shards of shard_size images each, and all
+        # labels into one array with the offsets of every image's rows, so training can
+        # read samples through a memory map without decoding (see PackedDetectionLoader).
+        # Images are packed in file name order
+        if(not os.path.exists(output_dir)):
+            os.makedirs(output_dir)
+
+        order = np.argsort(self.imgs)
+        img, classes_and_boxes = self.LoadFiles(order[0])
+        height, width = img.shape[0], img.shape[1]
+
+        processes = processes if processes > 0 else os.cpu_count()
+        shards = []
+        labels = []
+        offsets = [0]
+        t0 = time.time()
+        with multiprocessing.Pool(processes) as pool:
+            files = [(self.imgs[i], self.labels[i]) for i in order]
+            for i, (img, classes_and_boxes) in enumerate(pool.imap(load_files, files, chunksize=16)):
+                if(i % shard_size == 0):
+                    if(len(shards) > 0):
+                        shard.flush()
+                        del shard
+                    shards.append("shard_{:05d}.npy".format(len(shards)))
+                    shard = np.lib.format.open_memmap(os.path.join(output_dir, shards[-1] + ".tmp"), mode="w+",
+                                                      dtype=np.uint8, shape=(min(shard_size, len(order) - i), height, width, 3))
+                if(img.shape != (height, width, 3)):
+                    print("Error: all images need to be {}x{} to be packed, {} is {}x{}".format(
+                        width, height, self.imgs[order[i]], img.shape[1], img.shape[0]))
+                    exit(1)
+                shard[i % shard_size] = img
+                labels.append(classes_and_boxes)
+                offsets.append(offsets[-1] + classes_and_boxes.shape[0])
+        shard.flush()
+        del shard
+
+        # the index is written last, a pack that was interrupted is never read
+        for f in shards:
+            os.replace(os.path.join(output_dir, f + ".tmp"), os.path.join(output_dir, f))
+        np.save(os.path.join(output_dir, "labels.npy"), np.concatenate(labels).astype(np.float64))
+        np.save(os.path.join(output_dir, "offsets.npy"), np.asarray(offsets, dtype=np.int64))
+        index = {"count": len(order), "height": height, "width": width, "shard_size": shard_size,
+                 "shards": shards, "names": [os.path.basename(self.imgs[i]) for i in order]}
+        with open(os.path.join(output_dir, "index.json.tmp"), 'w') as f:
+            json.dump(index, f)
+        os.replace(os.path.join(output_dir, "index.json.tmp"), os.path.join(output_dir, "index.json"))
+
+        t1 = time.time()
+        print("Packed {} imgs with {} boxes into {} shards in {:.1f} s ({:.1f} imgs/s)".format(
+            len(order), offsets[-1], len(shards), t1-t0, len(order)/(t1-t0)))
+
+    def MakeSample(self, img, classes_and_boxes):
+        # turns an rgb image and its normalized label rows into the training sample
+        boxes = np.asarray([.5, .5, .2, .2]*self.max_boxes).reshape((self.max_boxes, 4))
+        classes = np.zeros(self.max_boxes)
+
+        #without boxes, the image is used as is
+        if(classes_and_boxes.shape[0] == 0):
+            #ensure correct datatypes
+            img = self.ToArray(img)
+            boxes = np.asarray([0, 0, 1, 1]*self.max_boxes).reshape((self.max_boxes, 4))
+            boxes = boxes.astype(np.int32)
+            classes = classes.astype(np.int64)
+            if(self.ragged):
+                return img,boxes[0:0],classes[0:0]
+            return img,boxes,classes
+
+        classes[0:classes_and_boxes.shape[0]] = classes_and_boxes[:,0] + 1
+        boxes[0:classes_and_boxes.shape[0],:] = classes_and_boxes[:,1:5]
+
+        #convert normalized boxes to index-based boxes
+        height = np.asarray(img).shape[0]
+        width = np.asarray(img).shape[1]
+
+        center_x = boxes[:,0].copy()
+        center_y = boxes[:,1].copy()
+        size_x = boxes[:,2].copy()
+        size_y = boxes[:,3].copy()
+
+        boxes[:,0] = np.clip(np.round((center_x-size_x/2) * width),0,width-2)
+        boxes[:,1] = np.clip(np.round((center_y-size_y/2) * height),0,height-2)
+        boxes[:,2] = np.clip(np.round((center_x+size_x/2) * width),boxes[:,0]+1,width-1)
+        boxes[:,3] = np.clip(np.round((center_y+size_y/2) * height),boxes[:,1]+1,height-1)
+        
+        #ensure correct datatypes and formats
+        boxes = boxes.astype(np.int32)
+        classes = classes.astype(np.int64)
+
+        #apply transforms
+        if(self.use_transforms):
+            img,boxes,classes = self.ApplyTransforms(Image.fromarray(np.asarray(img)),boxes,classes)
+
+        #ensure correct image format and channels first
+        img = self.ToArray(img)
+
+        # only the labeled boxes, for batching with collate_detections
+        if(self.ragged):
+            keep = classes > 0
+            return img, boxes[keep], classes[keep]
+
+        return img, boxes, classes
+
+    def ToArray(self, img):
+        # channels first rgb, kept as uint8 for augmenting whole batches later (see
+        # augmentation.BatchAugmentation) or converted straight to float32 in [0,1]
+        img = np.transpose(np.asarray(img), (2, 0, 1))[0:3, :, :]
+        if(self.uint8_images):
+            return np.ascontiguousarray(img)
+        img = np.ascontiguousarray(img, dtype=np.float32)
+        img /= 255.0
+        return img
+
 
     def ApplyTransforms(self,img,boxes,classes):
         #get height and width parameters
@@ -286,67 +461,122 @@ class ObjectDetectionImgLoader(torch.utils.data.Dataset):
             idx = idx.tolist()
 
         # load files
-        img = Image.open(self.imgs[idx])        
-        boxes = np.asarray([.5, .5, .2, .2]*self.max_boxes).reshape((self.max_boxes, 4))
-        classes = np.zeros(self.max_boxes)
-
-        #if the boxes file doesn't exist, it means there were no boxes in that image
-        if(not os.path.exists(self.labels[idx])):
-            #ensure correct datatypes
-            img = np.asarray(img)/255.0
-            img = np.transpose(img, (2, 0, 1)).astype(np.float32)[0:3, :, :]
-            boxes = np.asarray([0, 0, 1, 1]*self.max_boxes).reshape((self.max_boxes, 4))
-            boxes = boxes.astype(np.int32)
-            classes = classes.astype(np.int64)
-            return img,boxes,classes
+        img, classes_and_boxes = self.LoadFiles(idx)
+        return self.MakeSample(img, classes_and_boxes)
 
-        classes_and_boxes = np.loadtxt(self.labels[idx]).reshape(-1,5)
 
-        classes[0:classes_and_boxes.shape[0]] = classes_and_boxes[:,0] + 1
-        boxes[0:classes_and_boxes.shape[0],:] = classes_and_boxes[:,1:5]
-
-        #convert normalized boxes to index-based boxes
-        height = np.asarray(img).shape[0]
-        width = np.asarray(img).shape[1]
+# reads samples written by ObjectDetectionImgLoader.Pack. The shards are memory mapped,
+# so a sample is a copy out of the page cache instead of a png decode
+class PackedDetectionLoader(ObjectDetectionImgLoader):
+    def __init__(self, data_root, max_boxes, apply_transforms=False, max_samples=-1, uint8_images=False, ragged=False):
+        self.name = "Packed Object Detection Loader"
+        self.data_root = data_root
+        self.max_boxes = max_boxes
+        self.max_samples = max_samples
+        self.uint8_images = uint8_images
+        self.ragged = ragged
+        self.packed_dir = os.path.join(self.data_root, "packed")
 
-        center_x = boxes[:,0].copy()
-        center_y = boxes[:,1].copy()
-        size_x = boxes[:,2].copy()
-        size_y = boxes[:,3].copy()
+        self.InitTransforms(apply_transforms)
 
-        boxes[:,0] = np.clip(np.round((center_x-size_x/2) * width),0,width-2)
-        boxes[:,1] = np.clip(np.round((center_y-size_y/2) * height),0,height-2)
-        boxes[:,2] = np.clip(np.round((center_x+size_x/2) * width),boxes[:,0]+1,width-1)
-        boxes[:,3] = np.clip(np.round((center_y+size_y/2) * height),boxes[:,1]+1,height-1)
-        
-        #ensure correct datatypes and formats
-        boxes = boxes.astype(np.int32)
-        classes = classes.astype(np.int64)
+        index_file = os.path.join(self.packed_dir, "index.json")
+        if(not os.path.exists(index_file)):
+            print("Error: packed dataset not found, run train.py --mode pack first. Index = {}".format(index_file))
+            exit(1)
 
-        #apply transforms
-        if(self.use_transforms):
-            img,boxes,classes = self.ApplyTransforms(img,boxes,classes)
+        with open(index_file) as f:
+            index = json.load(f)
+        self.count = index["count"]
+        self.shard_size = index["shard_size"]
+        self.shard_files = [os.path.join(self.packed_dir, f) for f in index["shards"]]
+        self.imgs = index["names"]
+        self.box_rows = np.load(os.path.join(self.packed_dir, "labels.npy"))
+        self.offsets = np.load(os.path.join(self.packed_dir, "offsets.npy"))
+
+        if(self.max_samples > 0 and self.max_samples < self.count):
+            self.count = self.max_samples
+            self.imgs = self.imgs[0:self.max_samples]
 
+        # mapped on first use, so every loader worker maps the shards itself
+        self.shards = [None for f in self.shard_files]
 
-        #TEMPORARILY BLUR IMAGES
-        # img = img.filter(ImageFilter.GaussianBlur(radius=1))
+        print("Data loaded. Imgs={}, Boxes={}, Shards={}".format(
+            self.count, self.offsets[self.count], len(self.shard_files)))
 
-        #ensure correct image format and channels first        
-        img = np.asarray(img)/255.0
-        img = np.transpose(img, (2, 0, 1)).astype(np.float32)[0:3, :, :]
+    def __getstate__(self):
+        # workers remap the shards instead of receiving copies of them
+        state = self.__dict__.copy()
+        state["shards"] = [None for f in self.shard_files]
+        return state
 
-        # fig, ax = plt.subplots()
-        # ax.imshow(img.transpose((1, 2, 0)))
-        # for b in boxes[classes>0,:]:
-        #     rect = patches.Rectangle(
-        #         (b[0], b[1]), b[2]-b[0], b[3]-b[1], linewidth=1, edgecolor='b', facecolor='none')
-        #     ax.add_patch(rect)
-        # plt.show()
+    def __len__(self):
+        return self.count
 
-        # cv2_img = cv2.cvtColor(img.transpose((1, 2, 0)), cv2.COLOR_RGB2BGR)
-        # cv2.imshow("training image", cv2_img)
-        # cv2.waitKey(0) # waits until a key is pressed
-        # cv2.destroyAllWindows() # destroys the window showing image
+    def __getitem__(self, idx):
+        if torch.is_tensor(idx):
+            idx = idx.tolist()
 
+        shard = idx // self.shard_size
+        if(self.shards[shard] is None):
+            self.shards[shard] = np.load(self.shard_files[shard], mmap_mode='r')
+        img = self.shards[shard][idx % self.shard_size]
+        classes_and_boxes = self.box_rows[self.offsets[idx]:self.offsets[idx+1]]
+        return self.MakeSample(img, classes_and_boxes)
+
+
+# a batch of images with the boxes of all images in one tensor, so a batch is moved to
+# the device with one copy for the images and one for the targets
+class DetectionBatch():
+    def __init__(self, imgs, targets, counts):
+        self.imgs = imgs  # (B,3,H,W), uint8 or float
+        self.targets = targets  # (M,5) float32 rows of [label, x0, y0, x1, y1]
+        self.counts = counts  # number of target rows of each image
+
+    @staticmethod
+    def from_data(data):
+        # batches of the default collate have padded (B,N,4) boxes and (B,N) labels
+        if(isinstance(data, DetectionBatch)):
+            return data
+        imgs, boxes, labels = data
+        keep = labels > 0
+        targets = torch.cat((labels[keep][:,None].float(), boxes[keep].float()), dim=1)
+        return DetectionBatch(imgs, targets, keep.sum(dim=1).tolist())
 
-        return img, boxes, classes
+    def __len__(self):
+        return self.imgs.shape[0]
+
+    def pin_memory(self):
+        # called by the DataLoader with pin_memory=True
+        return DetectionBatch(self.imgs.pin_memory(), self.targets.pin_memory(), self.counts)
+
+    def to(self, device):
+        return DetectionBatch(self.imgs.to(device, non_blocking=True), self.targets.to(device, non_blocking=True), self.counts)
+
+    def boxes(self):
+        return self.targets[:,1:5]
+
+    def labels(self):
+        return self.targets[:,0].long()
+
+    def nbytes(self):
+        return self.imgs.nelement() * self.imgs.element_size() + self.targets.nelement() * self.targets.element_size()
+
+# collate_fn for the detection datasets, works with ragged and padded samples
+def collate_detections(samples):
+    shape = samples[0][0].shape
+    dtype = torch.from_numpy(samples[0][0]).dtype
+    imgs = torch.empty((len(samples),) + shape, dtype=dtype)
+    if(torch.utils.data.get_worker_info() is not None):
+        # like the default collate, write straight into shared memory in loader workers
+        # instead of copying the batch there when it is sent
+        imgs = imgs.share_memory_()
+    torch.stack([torch.from_numpy(s[0]) for s in samples], out=imgs)
+
+    rows = []
+    counts = []
+    for img, boxes, classes in samples:
+        keep = classes > 0
+        rows.append(np.concatenate((classes[keep, None], boxes[keep]), axis=1).astype(np.float32))
+        counts.append(int(np.sum(keep)))
+    targets = torch.from_numpy(np.concatenate(rows).reshape((-1,5)))
+    return DetectionBatch(imgs, targets, counts)
@@ -0,0 +1,204 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+
+def box_iou(boxes_a, boxes_b):
+    # (N,4) and (M,4) boxes as x0,y0,x1,y1 -> (N,M) intersection over union
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape((-1,4))
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape((-1,4))
+
+    area_a = (boxes_a[:,2] - boxes_a[:,0]) * (boxes_a[:,3] - boxes_a[:,1])
+    area_b = (boxes_b[:,2] - boxes_b[:,0]) * (boxes_b[:,3] - boxes_b[:,1])
+
+    w = np.clip(np.minimum(boxes_a[:,None,2], boxes_b[None,:,2]) - np.maximum(boxes_a[:,None,0], boxes_b[None,:,0]), 0, None)
+    h = np.clip(np.minimum(boxes_a[:,None,3], boxes_b[None,:,3]) - np.maximum(boxes_a[:,None,1], boxes_b[None,:,1]), 0, None)
+    intersection = w * h
+    union = area_a[:,None] + area_b[None,:] - intersection
+
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+def match_boxes(iou, method="greedy", min_iou=0.0):
+    # one to one matching of the rows and columns of an iou matrix, returns the matched
+    # (row ids, column ids) with an iou above min_iou. "greedy" repeatedly takes the
+    # largest remaining iou, "hungarian" maximizes the total iou
+    iou = np.asarray(iou, dtype=np.float64)
+    if(iou.size == 0):
+        return np.zeros((0), dtype=np.int64), np.zeros((0), dtype=np.int64)
+
+    if(method == "hungarian"):
+        from scipy.optimize import linear_sum_assignment
+        rows, cols = linear_sum_assignment(iou, maximize=True)
+    elif(method == "greedy"):
+        # visiting all pairs in order of decreasing iou is the same as repeatedly taking the max
+        order = np.argsort(-iou, axis=None, kind='stable')
+        order = order[iou.ravel()[order] > min_iou]
+        rows = []
+        cols = []
+        used_rows = np.zeros(iou.shape[0], dtype=bool)
+        used_cols = np.zeros(iou.shape[1], dtype=bool)
+        for r, c in zip(*np.unravel_index(order, iou.shape)):
+            if(used_rows[r] or used_cols[c]):
+                continue
+            used_rows[r] = True
+            used_cols[c] = True
+            rows.append(r)
+            cols.append(c)
+            if(len(rows) == min(iou.shape)):
+                break
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+    else:
+        raise ValueError("Unknown matching method '{}'".format(method))
+
+    keep = iou[rows, cols] > min_iou
+    return rows[keep], cols[keep]
+
+def average_precision(scores, true_positives, num_gt):
+    # area under the interpolated precision/recall curve of a class
+    if(num_gt == 0):
+        return float('nan')
+    if(len(scores) == 0):
+        return 0.0
+    order = np.argsort(-np.asarray(scores), kind='stable')
+    tp = np.asarray(true_positives, dtype=np.float64)[order]
+    tp_sum = np.cumsum(tp)
+    fp_sum = np.cumsum(1 - tp)
+    recall = np.concatenate(([0.0], tp_sum / num_gt))
+    precision = np.concatenate(([1.0], tp_sum / (tp_sum + fp_sum)))
+    # precision envelope, the best precision at this recall or any higher one
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+# accumulates detection metrics image by image. Labels are 1 based, 0 is background
+class DetectionMetrics():
+    def __init__(self, num_classes=2, iou_threshold=0.5, matching="greedy"):
+        self.num_classes = num_classes
+        self.iou_threshold = iou_threshold
+        self.matching = matching
+        self.reset()
+
+    def reset(self):
+        self.images = 0
+        # mean iou over matched pairs, unmatched predictions and unmatched boxes count as 0
+        self.iou_sum = 0.0
+        self.pairs = 0
+        # per class scores and true positive flags of the predictions, and labeled box counts
+        self.scores = [[] for c in range(self.num_classes)]
+        self.true_positives = [[] for c in range(self.num_classes)]
+        self.num_gt = np.zeros(self.num_classes, dtype=np.int64)
+
+    def add(self, pred_boxes, pred_labels, pred_scores, gt_boxes, gt_labels):
+        pred_boxes = np.asarray(pred_boxes, dtype=np.float64).reshape((-1,4))
+        pred_labels = np.asarray(pred_labels).reshape((-1))
+        pred_scores = np.asarray(pred_scores, dtype=np.float64).reshape((-1))
+        gt_boxes = np.asarray(gt_boxes, dtype=np.float64).reshape((-1,4))
+        gt_labels = np.asarray(gt_labels).reshape((-1))
+
+        keep = pred_labels > 0
+        pred_boxes, pred_labels, pred_scores = pred_boxes[keep], pred_labels[keep], pred_scores[keep]
+        keep = gt_labels > 0
+        gt_boxes, gt_labels = gt_boxes[keep], gt_labels[keep]
+        self.images += 1
+
+        # match on all classes together to include mislabeling in the iou
+        iou = box_iou(pred_boxes, gt_boxes)
+        rows, cols = match_boxes(iou, self.matching)
+        self.iou_sum += float(np.sum(iou[rows, cols]))
+        self.pairs += len(pred_labels) + len(gt_labels) - len(rows)
+
+        # per class true positives at the iou threshold, labels have to agree
+        same_class = pred_labels[:,None] == gt_labels[None,:]
+        rows, cols = match_boxes(np.where(same_class, iou, 0.0), self.matching, self.iou_threshold - 1e-12)
+        tp = np.zeros(len(pred_labels), dtype=bool)
+        tp[rows] = True
+        for c in range(self.num_classes):
+            ids = pred_labels == c + 1
+            self.scores[c].extend(pred_scores[ids].tolist())
+            self.true_positives[c].extend(tp[ids].tolist())
+            self.num_gt[c] += int(np.sum(gt_labels == c + 1))
+
+    def merge(self, other):
+        # adds the images of another DetectionMetrics, e.g. from another training rank
+        self.images += other.images
+        self.iou_sum += other.iou_sum
+        self.pairs += other.pairs
+        for c in range(self.num_classes):
+            self.scores[c].extend(other.scores[c])
+            self.true_positives[c].extend(other.true_positives[c])
+        self.num_gt += other.num_gt
+
+    def mean_iou(self):
+        return self.iou_sum / self.pairs if self.pairs > 0 else float('nan')
+
+    def summary(self):
+        result = {'images': self.images, 'mean_iou': self.mean_iou()}
+        aps = []
+        for c in range(self.num_classes):
+            tp = np.asarray(self.true_positives[c], dtype=np.float64)
+            predicted = len(tp)
+            found = float(np.sum(tp))
+            result['precision_{}'.format(c+1)] = found / predicted if predicted > 0 else float('nan')
+            result['recall_{}'.format(c+1)] = found / int(self.num_gt[c]) if self.num_gt[c] > 0 else float('nan')
+            ap = average_precision(self.scores[c], tp, self.num_gt[c])
+            result['ap_{}'.format(c+1)] = ap
+            if(not np.isnan(ap)):
+                aps.append(ap)
+        result['map'] = float(np.mean(aps)) if len(aps) > 0 else float('nan')
+        return result
+
+# sums the loss terms of a detection model over a pass. Losses are kept as detached
+# tensors so the device only synchronizes when the summary is read
+class LossAccumulator():
+    def __init__(self):
+        self.totals = {}
+        self.batches = 0
+
+    def add(self, loss_dict):
+        for k, v in loss_dict.items():
+            self.totals[k] = self.totals.get(k, 0) + v.detach()
+        self.batches += 1
+
+    def merge(self, other):
+        # adds the batches of another LossAccumulator, e.g. from another training rank
+        for k, v in other.totals.items():
+            self.totals[k] = self.totals.get(k, 0) + float(v)
+        self.batches += other.batches
+
+    def mean(self):
+        # mean of the summed loss terms per batch
+        if(self.batches == 0):
+            return float('nan')
+        return sum(float(v) for v in self.totals.values()) / self.batches
+
+    def summary(self):
+        result = dict((k, float(v) / self.batches) for k, v in self.totals.items()) if self.batches > 0 else {}
+        result['loss'] = self.mean()
+        return result
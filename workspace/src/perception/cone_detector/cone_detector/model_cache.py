@@ -0,0 +1,75 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import hashlib
+import json
+import os
+
+import torch
+
+# cache of prepared inference models. The first start with a given model file, backend,
+# precision and device scripts and freezes the loaded network and stores it as
+# model_<key>.pt in the cache directory, later starts load that file directly without
+# building the torchvision network or fetching pretrained backbone weights.
+class ModelCache():
+    def __init__(self, cache_dir):
+        self.cache_dir = os.path.expanduser(cache_dir)
+
+    def key(self, model_file, **config):
+        h = hashlib.sha256()
+        with open(model_file, "rb") as f:
+            for chunk in iter(lambda: f.read(1<<20), b""):
+                h.update(chunk)
+        # artifacts are not portable across torch versions
+        config['torch'] = torch.__version__
+        h.update(json.dumps(config, sort_keys=True).encode())
+        return h.hexdigest()[0:16]
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, "model_{}.pt".format(key))
+
+    def load(self, network, key):
+        # loads the cached model into network, False if there is none
+        path = self.path(key)
+        if(not os.path.exists(path)):
+            return False
+        network.load_scripted(path)
+        return True
+
+    def store(self, network, key):
+        if(not os.path.exists(self.cache_dir)):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+        # write to a temporary file first so concurrent starts never load a partial model
+        path = self.path(key)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        network.save_scripted(tmp_path, freeze=True)
+        os.replace(tmp_path, path)
+        return path
@@ -34,17 +34,16 @@ from rclpy.node import Node
 from sensor_msgs.msg import Image
 from art_msgs.msg import VehicleState
 from art_perception_msgs.msg import ObjectArray, Object
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
 from ament_index_python.packages import get_package_share_directory
 import torch
 import torchvision
 import time
 import numpy as np
-import matplotlib
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
 
 from rclpy.qos import QoSHistoryPolicy
 from rclpy.qos import QoSProfile
+from art_visualization.shared_ring import SharedRingWriter
 
 import sys
 import os
@@ -54,22 +53,32 @@ ament_tools_root = os.path.join(os.path.dirname(__file__), '.')
 sys.path.insert(0, os.path.abspath(ament_tools_root))
 
 from recognition_network import RecognitionNetwork
+from inference_backend import TorchBackend, OnnxRuntimeBackend
+from preprocessing import ImagePreprocessor
+from inference_worker import LatestFrameMailbox, InferenceWorker
+from camera_model import CameraModel
+from ground_projection import GroundProjector
+from region_of_interest import GroundRegionOfInterest
+from resolution_controller import ResolutionController
+from cone_tracker import ConeTracker
+from timing import StageTimer
+from model_cache import ModelCache
+from cpu_profile import CpuProfile
 
 class ObjectRecognitionNode(Node):
     def __init__(self):
         super().__init__('object_recognition_node')
+        self.start_time = time.perf_counter()
+        self.first_detection = False
 
         # update frequency of this node
         self.freq = 10.0
+        self.diagnostics_freq = 1.0
 
         self.go = False
 
         # data that will be used by this class
         self.state = ""
-        self.prediction = {}
-        self.prediction['boxes'] = torch.tensor([])
-        self.prediction['labels'] = torch.tensor([])
-        self.prediction['scores'] = torch.tensor([])
 
         self.threshold = 0.001
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
@@ -80,27 +89,189 @@ class ObjectRecognitionNode(Node):
         # READ IN PARAMETERS
         self.declare_parameter('model', "")
         self.model_file = self.get_parameter('model').get_parameter_value().string_value
+        # "auto" runs fp16 when cuda is available and fp32 otherwise, "int8" runs the
+        # quantized model (see train.py --mode quantize) on the cpu
+        self.declare_parameter('precision', "auto")
+        self.precision = self.get_parameter('precision').get_parameter_value().string_value
+        self.declare_parameter('quantized_model', "")
+        self.quantized_model_file = self.get_parameter('quantized_model').get_parameter_value().string_value
+        if(self.precision == "auto"):
+            self.precision = "fp16" if torch.cuda.is_available() else "fp32"
+        if(self.precision == "int8" and self.quantized_model_file == ""):
+            self.get_logger().error("precision 'int8' requires the quantized_model parameter, using fp32")
+            self.precision = "fp32"
+        if(self.precision not in ["fp32", "fp16", "int8"]):
+            self.get_logger().warn("Unknown precision '%s', using fp32" % self.precision)
+            self.precision = "fp32"
+        # "torch" runs the model in pytorch, "onnxruntime" runs the onnx_model file
+        # (see train.py --mode export) through onnx runtime on the cpu
+        self.declare_parameter('backend', "torch")
+        self.backend_name = self.get_parameter('backend').get_parameter_value().string_value
+        self.declare_parameter('onnx_model', "")
+        self.onnx_model_file = self.get_parameter('onnx_model').get_parameter_value().string_value
+        if(self.backend_name not in ["torch", "onnxruntime"]):
+            self.get_logger().warn("Unknown backend '%s', using torch" % self.backend_name)
+            self.backend_name = "torch"
+        if(self.backend_name == "onnxruntime"):
+            self.precision = "fp32"
+        if(self.precision == "int8" or self.backend_name == "onnxruntime"):
+            self.device = "cpu"
         self.declare_parameter('vis', False)
         self.vis = self.get_parameter('vis').get_parameter_value().bool_value
         self.declare_parameter('camera_calibration_file', "")
         self.camera_calibration_file = self.get_parameter('camera_calibration_file').get_parameter_value().string_value
 
-        self.camera_params = json.load(open(os.path.join(package_share_directory,self.camera_calibration_file)))
-        self.get_logger().info("Cam params '%s'" % str(self.camera_params))
-
-        # publishers and subscribers
+        # multiple cameras: one calibration file per camera, frames closer in time than
+        # sync_tolerance of the newest frame are run through the network as one batch, older
+        # ones are dropped
+        self.declare_parameter('camera_calibration_files', [""])
+        self.camera_calibration_files = [f for f in self.get_parameter('camera_calibration_files').get_parameter_value().string_array_value if f != ""]
+        if(len(self.camera_calibration_files) == 0):
+            self.camera_calibration_files = [self.camera_calibration_file]
+        self.declare_parameter('sync_tolerance', 0.02)
+        self.sync_tolerance = self.get_parameter('sync_tolerance').get_parameter_value().double_value
+        self.declare_parameter('batch_gather_time', 0.01)
+        self.batch_gather_time = self.get_parameter('batch_gather_time').get_parameter_value().double_value
+
+        # "inference" publishes one ObjectArray per processed frame as soon as it is available,
+        # "timer" republishes the latest detections at a fixed rate
+        self.declare_parameter('publish_mode', "inference")
+        self.publish_mode = self.get_parameter('publish_mode').get_parameter_value().string_value
+        if(self.publish_mode not in ["inference", "timer"]):
+            self.get_logger().warn("Unknown publish_mode '%s', using 'inference'" % self.publish_mode)
+            self.publish_mode = "inference"
+
+        # crop each frame to the band below the horizon where cones up to roi_max_range
+        # meters away can appear before running the detector
+        self.declare_parameter('roi', False)
+        self.use_roi = self.get_parameter('roi').get_parameter_value().bool_value
+        self.declare_parameter('roi_max_range', 10.0)
+        self.roi_max_range = self.get_parameter('roi_max_range').get_parameter_value().double_value
+        self.declare_parameter('roi_ground_height', 0.0)
+        self.roi_ground_height = self.get_parameter('roi_ground_height').get_parameter_value().double_value
+        self.declare_parameter('roi_margin', 8)
+        self.roi_margin = self.get_parameter('roi_margin').get_parameter_value().integer_value
+
+        # run the network at the largest of resolution_scales whose rolling inference
+        # latency stays under latency_budget seconds
+        self.declare_parameter('adaptive_resolution', False)
+        self.adaptive_resolution = self.get_parameter('adaptive_resolution').get_parameter_value().bool_value
+        self.declare_parameter('resolution_scales', [1.0, 0.75, 0.5])
+        self.resolution_scales = list(self.get_parameter('resolution_scales').get_parameter_value().double_array_value)
+        self.declare_parameter('latency_budget', 0.05)
+        self.latency_budget = self.get_parameter('latency_budget').get_parameter_value().double_value
+
+        # run the detector on every detect_interval-th frame of a camera and track the cones
+        # in between, the detector also runs when a track's confidence drops below
+        # min_track_confidence. Only detections scoring at least track_min_score are tracked
+        self.declare_parameter('detect_interval', 1)
+        self.detect_interval = self.get_parameter('detect_interval').get_parameter_value().integer_value
+        self.declare_parameter('min_track_confidence', 0.3)
+        self.min_track_confidence = self.get_parameter('min_track_confidence').get_parameter_value().double_value
+        self.declare_parameter('track_min_score', 0.5)
+        self.track_min_score = self.get_parameter('track_min_score').get_parameter_value().double_value
+
+        # location for cached artifacts such as camera ray tables
+        self.declare_parameter('cache_dir', os.path.join("~", ".cache", "cone_detector"))
+        self.cache_dir = self.get_parameter('cache_dir').get_parameter_value().string_value
+
+        # per stage latency histograms are published on the diagnostics topic and written to
+        # timing_file (default <cache_dir>/latency.json) on shutdown, log_timing also logs every frame
+        self.declare_parameter('log_timing', False)
+        self.log_timing = self.get_parameter('log_timing').get_parameter_value().bool_value
+        self.declare_parameter('timing_file', "")
+        self.timing_file = self.get_parameter('timing_file').get_parameter_value().string_value
+        if(self.timing_file == ""):
+            self.timing_file = os.path.join(self.cache_dir, "latency.json")
+        # thread counts, core affinity, memory format and grad mode for cpu inference, written
+        # by benchmark.py --mode cpu_tune. Defaults apply when empty
+        self.declare_parameter('cpu_profile', "")
+        self.cpu_profile_file = self.get_parameter('cpu_profile').get_parameter_value().string_value
+        self.cpu_profile = CpuProfile()
+        if(self.cpu_profile_file != ""):
+            self.cpu_profile = CpuProfile.from_file(os.path.join(package_share_directory,self.cpu_profile_file))
+        try:
+            self.cpu_profile.apply()
+        except (RuntimeError, OSError) as e:
+            self.get_logger().warn("CPU profile only partially applied: %s" % str(e))
+        self.get_logger().info("CPU profile %s" % str(self.cpu_profile.to_dict()))
+
+        # keep prepared torch models in cache_dir so later starts skip building the network
+        self.declare_parameter('model_cache', True)
+        self.use_model_cache = self.get_parameter('model_cache').get_parameter_value().bool_value
+        self.timing = StageTimer(["decode", "preprocess", "inference", "postprocess", "projection", "publish", "total"])
+
+        self.num_cameras = len(self.camera_calibration_files)
+        self.camera_models = []
+        self.projectors = []
+        for f in self.camera_calibration_files:
+            self.camera_models.append(CameraModel.from_file(os.path.join(package_share_directory,f), self.cache_dir))
+            self.projectors.append(GroundProjector(self.camera_models[-1]))
+            self.get_logger().info("Cam params '%s'" % str(self.camera_models[-1].params))
+
+        self.rois = [None] * self.num_cameras
+        if(self.use_roi):
+            self.rois = [GroundRegionOfInterest(m, self.roi_max_range, self.roi_ground_height, margin=self.roi_margin) for m in self.camera_models]
+            # cameras are batched together, so all crops get the same size
+            rows = max(roi.size()[1] for roi in self.rois)
+            for c, roi in enumerate(self.rois):
+                roi.extend_to(rows)
+                self.get_logger().info("Camera %s ROI: horizon row = %s, rows %s to %s" % (str(c), str(roi.horizon_row), str(roi.top), str(roi.bottom)))
+
+        self.trackers = [None] * self.num_cameras
+        if(self.detect_interval > 1):
+            self.trackers = [ConeTracker(max_misses=self.detect_interval) for c in range(self.num_cameras)]
+        self.frame_counts = [0] * self.num_cameras
+
+        # latest (image msg, detections) for each camera
+        self.results = [None] * self.num_cameras
+
+        # publishers and subscribers, topics are suffixed with the camera index when there is more than one camera
         qos_profile = QoSProfile(depth=1)
         qos_profile.history = QoSHistoryPolicy.KEEP_LAST
-        self.sub_image = self.create_subscription(Image, '~/input/image', self.image_callback, qos_profile)
+        self.sub_images = []
+        self.pub_objects = []
+        for c in range(self.num_cameras):
+            suffix = "" if self.num_cameras == 1 else "_{}".format(c)
+            self.sub_images.append(self.create_subscription(Image, '~/input/image' + suffix, lambda msg, c=c: self.image_callback(msg, c), qos_profile))
+            self.pub_objects.append(self.create_publisher(ObjectArray, '~/output/objects' + suffix, 10))
         self.sub_state = self.create_subscription(VehicleState, '~/input/vehicle_state', self.state_callback, qos_profile)
-        self.pub_objects = self.create_publisher(ObjectArray, '~/output/objects', 10)
+        self.pub_diagnostics = self.create_publisher(DiagnosticArray, '~/output/diagnostics', 10)
         self.timer = self.create_timer(1/self.freq, self.pub_callback)
+        self.diagnostics_timer = self.create_timer(1/self.diagnostics_freq, self.diagnostics_callback)
 
         # object recognition
-        self.model = RecognitionNetwork()
-        self.model.load(os.path.join(package_share_directory,self.model_file))
+        if(self.backend_name == "onnxruntime"):
+            self.model = OnnxRuntimeBackend(os.path.join(package_share_directory,self.onnx_model_file), threads=self.cpu_profile.threads)
+        else:
+            t0 = time.perf_counter()
+            source = self.quantized_model_file if self.precision == "int8" else self.model_file
+            source = os.path.join(package_share_directory,source)
+            cache = ModelCache(self.cache_dir) if self.use_model_cache and self.cache_dir != "" else None
+            key = cache.key(source, backend=self.backend_name, precision=self.precision, device=str(self.device), channels_last=self.cpu_profile.channels_last) if cache is not None else None
+
+            network = RecognitionNetwork(self.device, build=False)
+            if(cache is not None and cache.load(network, key)):
+                self.get_logger().info("Loaded cached model %s" % cache.path(key))
+            else:
+                # the backbone weights come from the model file, so nothing is downloaded
+                if(self.precision == "int8"):
+                    network.load_scripted(source)
+                else:
+                    network = RecognitionNetwork(self.device, pretrained_backbone=False)
+                    network.load(source)
+                    network.model = self.cpu_profile.prepare(network.model)
+                if(self.precision == "fp16"):
+                    network.model.half()
+                if(cache is not None):
+                    try:
+                        self.get_logger().info("Cached model at %s" % cache.store(network, key))
+                    except (OSError, RuntimeError) as e:
+                        self.get_logger().warn("Could not cache model: %s" % str(e))
+            self.model = TorchBackend(network)
+            self.get_logger().info("Model loaded in %.3f s" % (time.perf_counter() - t0))
         self.model.eval()
-        self.get_logger().info('Model initialized | visualizing = %s | device = %s' % (str(self.vis),str(self.device)))
+        self.get_logger().info('Model initialized | visualizing = %s | device = %s | backend = %s | precision = %s | cameras = %s | publish mode = %s | detect interval = %s' % (str(self.vis),str(self.device),self.backend_name,self.precision,str(self.num_cameras),self.publish_mode,str(self.detect_interval)))
 
 
         # nn optimizations
@@ -109,22 +280,47 @@ class ObjectRecognitionNode(Node):
         torch.backends.cudnn.benchmark = True
         torch.backends.cudnn.enabled = True
 
-        if(torch.cuda.is_available()):
-            self.model.model.half()
+        input_dtype = torch.float16 if self.precision == "fp16" else torch.float32
+
+        # network input size
+        self.input_width = self.camera_models[0].width
+        self.input_height = self.camera_models[0].height
+        if(self.use_roi and not self.model.supports_dynamic_size):
+            self.get_logger().warn("ROI cropping disabled: the %s backend runs at the input size it was exported with" % self.backend_name)
+            self.use_roi = False
+            self.rois = [None] * self.num_cameras
+        if(self.use_roi):
+            self.input_width, self.input_height = self.rois[0].size()
+            self.model.set_input_size(self.input_width, self.input_height)
+
+        self.resolution_controller = None
+        if(self.adaptive_resolution and not self.model.supports_dynamic_size):
+            self.get_logger().warn("Adaptive resolution disabled: the %s backend runs at the input size it was exported with" % self.backend_name)
+        elif(self.adaptive_resolution):
+            self.resolution_controller = ResolutionController(self.resolution_scales, self.latency_budget)
+            self.set_resolution_scale(self.resolution_controller.scale())
+
+        # preprocessing into reused input buffers, one set per camera since a batch holds all of them at once
+        self.preprocessors = [ImagePreprocessor(self.device, input_dtype) for c in range(self.num_cameras)]
 
         #run a first test for optimization
-        dummy_input = torch.rand((3,720,1280),dtype=torch.float32,device=self.device)
-        if(torch.cuda.is_available()):
-            dummy_input = torch.rand((3,720,1280),dtype=torch.float16,device=self.device)
-        self.model.predict([dummy_input])
+        dummy_input = torch.rand((3,self.input_height,self.input_width),dtype=input_dtype,device=self.device)
+        with self.cpu_profile.context():
+            self.model.predict([dummy_input] * self.num_cameras)
 
         if(self.vis):
-            matplotlib.use("TKAgg")
-            self.fig, self.ax = plt.subplots()
-            plt.title("Object Recognition")
-            self.im_show = None
-            self.patches = []
-            self.counter = 0
+            # drawn by the art_visualization visualizer process, room for the largest 4 channel image
+            slot_size = max(4 * m.width * m.height for m in self.camera_models) + (1<<16)
+            self.vis_ring = SharedRingWriter("cone_detector", slot_size=slot_size)
+            self.vis_pushed = None
+
+        # inference runs on its own thread on the newest frames, the executor only hands frames over
+        self.mailbox = LatestFrameMailbox(self.num_cameras, stamp=lambda msg: rclpy.time.Time.from_msg(msg.header.stamp).nanoseconds / 1e9)
+        self.worker = InferenceWorker(self.mailbox, self.process_images, self.worker_error,
+                                      gather_time=self.batch_gather_time, tolerance=self.sync_tolerance)
+        self.worker.start()
+        self.last_counters = self.worker.counters()
+        self.last_counters_time = time.time()
 
     # function to process data this class subscribes to
 
@@ -132,146 +328,233 @@ class ObjectRecognitionNode(Node):
         # self.get_logger().info("Received '%s'" % msg)
         self.state = msg
 
-    def image_callback(self, msg):
-        self.go = True
+    def image_callback(self, msg, camera=0):
         # self.get_logger().info("Received image msg")
-        self.image = msg
+        self.mailbox.put(msg, camera)
 
-        t0 = time.time()
-        
-        h = self.image.height
-        w = self.image.width
-        # self.get_logger().info("Image msg data: {} x {}".format(w,h))
-        x = np.asarray(self.image.data).reshape(
-            h, w, -1).astype(np.float32) / 255.0
+    # runs on the inference worker thread with a list of (camera, image msg) pairs
+    def process_images(self, batch):
+        t0 = time.perf_counter()
 
-        # x = np.flip(x,axis=0).copy()
-
-        if self.image.encoding == "bgr8":
-            x = np.flip(x[:,:,0:3],axis=2).copy()
-
-        torch_img = None 
-        if torch.cuda.is_available():
-            torch_img = torch.from_numpy(x.transpose(2, 0, 1)[0:3, :, :]).half().to(self.device)
-        else:
-            torch_img = torch.from_numpy(x.transpose(2, 0, 1)[0:3, :, :]).to(self.device)
-        t1 = time.time()
+        # frames of cameras that are not due for a detection only advance the tracker
+        detect = [(c, msg) for c, msg in batch if self.needs_detection(c)]
+        for c, msg in batch:
+            self.frame_counts[c] += 1
 
-        if self.vis:
-            if self.im_show == None:
-                self.im_show = self.ax.imshow(x)
-            else:
-                self.im_show.set_data(x)
+        decoded = [self.preprocessors[c].decode(msg) for c, msg in detect]
+        t1 = time.perf_counter()
+        torch_imgs = [self.preprocessors[c].normalize(*src) for (c, msg), src in zip(detect, decoded)]
+        if(self.use_roi):
+            torch_imgs = [self.rois[c].crop(img) for (c, msg), img in zip(detect, torch_imgs)]
+        t2 = time.perf_counter()
 
         # self.get_logger().warn(torch_img)
-        self.prediction = self.model.predict([torch_img])[0]
+        predictions = []
+        if(len(detect) > 0):
+            self.timing.record("decode", t1 - t0)
+            self.timing.record("preprocess", t2 - t1)
+            with self.cpu_profile.context():
+                predictions = self.model.predict(torch_imgs)
+            inference_time = time.perf_counter() - t2
+            self.timing.record("inference", inference_time)
+            if(not self.first_detection):
+                self.first_detection = True
+                self.get_logger().info("First detection %.3f s after start" % (time.perf_counter() - self.start_time))
+            if(self.resolution_controller is not None and self.resolution_controller.record(inference_time)):
+                self.set_resolution_scale(self.resolution_controller.scale())
+        predictions = dict((c, prediction) for (c, msg), prediction in zip(detect, predictions))
+
+        for c, msg in batch:
+            t3 = time.perf_counter()
+            if(c in predictions):
+                prediction = predictions[c]
+                if(self.use_roi):
+                    prediction = self.rois[c].uncrop(prediction)
+                detections = self.extract_detections(c, prediction)
+            else:
+                detections = self.track_detections(c)
+            t4 = time.perf_counter()
+            # project all boxes at once
+            detections['positions'] = self.projectors[c].project_boxes(detections['boxes'])
+            t5 = time.perf_counter()
+            self.timing.record("postprocess", t4 - t3)
+            self.timing.record("projection", t5 - t4)
+
+            self.results[c] = (msg, detections)
+            if(self.publish_mode == "inference"):
+                self.publish_objects(c, msg, detections)
+        self.go = True
 
-        t2 = time.time()
-        t = self.get_clock().now()
-        # t_msg = self.get_clock().now()
-        t_msg = rclpy.time.Time.from_msg(self.image.header.stamp)
-        collection_to_perception = (t.nanoseconds - t_msg.nanoseconds) / 1e9
-        self.get_logger().info('Inference= %s, Col2Perc= %s, ID= %s' % ("{:.4f}".format(t2-t0),"{:.4f}".format(collection_to_perception),self.image.header.frame_id))
+        t6 = time.perf_counter()
+        self.timing.record("total", t6 - t0)
+        if(self.log_timing):
+            t = self.get_clock().now()
+            for c, msg in batch:
+                # t_msg = self.get_clock().now()
+                t_msg = rclpy.time.Time.from_msg(msg.header.stamp)
+                collection_to_perception = (t.nanoseconds - t_msg.nanoseconds) / 1e9
+                self.get_logger().info('Inference= %s, Col2Perc= %s, ID= %s, Batch= %s' % ("{:.4f}".format(t6-t0),"{:.4f}".format(collection_to_perception),msg.header.frame_id,str(len(batch))))
+        return len(detect)
+
+    def needs_detection(self, camera):
+        tracker = self.trackers[camera]
+        if(tracker is None):
+            return True
+        return self.frame_counts[camera] % self.detect_interval == 0 or tracker.confidence() < self.min_track_confidence
+
+    def set_resolution_scale(self, scale):
+        # the network resizes its input and maps boxes back to the input size itself
+        self.model.set_input_size(round(scale * self.input_width), round(scale * self.input_height))
+
+    def worker_error(self, e):
+        self.get_logger().error("Inference failed: %s" % str(e))
+
+    def diagnostics_callback(self):
+        counters = self.worker.counters()
+        now = time.time()
+        dt = now - self.last_counters_time
+
+        status = DiagnosticStatus()
+        status.level = DiagnosticStatus.OK
+        status.name = self.get_name() + ": inference worker"
+        status.message = "frame counters"
+        for key, value in counters.items():
+            status.values.append(KeyValue(key=key, value=str(value)))
+        for key in ["frames_received", "frames_inferred", "frames_tracked"]:
+            rate = (counters[key] - self.last_counters[key]) / dt if dt > 0 else 0.0
+            status.values.append(KeyValue(key=key.replace("frames_", "") + "_hz", value="{:.2f}".format(rate)))
+
+        self.last_counters = counters
+        self.last_counters_time = now
+
+        msg = DiagnosticArray()
+        msg.header.stamp = self.get_clock().now().to_msg()
+        msg.status.append(status)
+
+        status = DiagnosticStatus()
+        status.level = DiagnosticStatus.OK
+        status.name = self.get_name() + ": latency"
+        status.message = "stage latencies in ms since start"
+        for stage, summary in self.timing.summary().items():
+            status.values.append(KeyValue(key=stage + "_count", value=str(summary['count'])))
+            for key in ['p50', 'p95', 'p99', 'max']:
+                status.values.append(KeyValue(key=stage + "_" + key, value="{:.3f}".format(1e3*summary[key])))
+        msg.status.append(status)
+
+        if(self.resolution_controller is not None):
+            scale = self.resolution_controller.scale()
+            latency = self.resolution_controller.latency()
+            status = DiagnosticStatus()
+            status.level = DiagnosticStatus.OK if latency is None or latency <= self.latency_budget else DiagnosticStatus.WARN
+            status.name = self.get_name() + ": resolution"
+            status.message = "adaptive input resolution"
+            status.values.append(KeyValue(key="scale", value="{:.3f}".format(scale)))
+            status.values.append(KeyValue(key="input_size", value="{}x{}".format(round(scale * self.input_width), round(scale * self.input_height))))
+            status.values.append(KeyValue(key="latency", value="nan" if latency is None else "{:.4f}".format(latency)))
+            status.values.append(KeyValue(key="latency_budget", value="{:.4f}".format(self.latency_budget)))
+            msg.status.append(status)
+        self.pub_diagnostics.publish(msg)
+
+    def destroy_node(self):
+        self.worker.stop()
+        try:
+            self.timing.dump(self.timing_file)
+            self.get_logger().info("Wrote stage latencies to %s" % self.timing_file)
+        except OSError as e:
+            self.get_logger().warn("Could not write stage latencies: %s" % str(e))
+        if(self.vis):
+            self.vis_ring.close()
+        super().destroy_node()
 
 
     def estimate_cone_distance(self, rectangle):
         return 1.0
 
-    def direction_to_pixel(self, px):
-
-        img_w = self.camera_params["width"]
-        img_h = self.camera_params["height"]
-        img_fov = self.camera_params["FOV"]
-
-        pt_x = -((px[0]+.5) / img_w * 2 - 1) # -1 to 1
-        pt_y = -((px[1]+.5) / img_h * 2 - 1) # -1 to 1 (flipped so -1 is bottom of image)
-        pt_y *= img_h / img_w
-
-        h_factor = img_fov / np.pi * 2.0
+    def extract_detections(self, camera, prediction):
+        boxes = prediction['boxes'].detach().cpu().numpy()
+        labels = prediction['labels'].detach().cpu().numpy()
+        scores = prediction['scores'].detach().cpu().numpy()
 
-        direction = np.array([1,pt_x*h_factor,pt_y*h_factor])
-        direction = direction / np.linalg.norm(direction)
+        keep = np.logical_and(scores > self.threshold, labels > 0)
 
+        detections = {}
+        detections['boxes'] = boxes[keep]
+        detections['labels'] = labels[keep]
+        detections['scores'] = scores[keep]
 
-        return direction
+        if(self.trackers[camera] is not None):
+            keep = detections['scores'] >= self.track_min_score
+            detections = self.trackers[camera].update(detections['boxes'][keep], detections['labels'][keep], detections['scores'][keep])
 
-    def calculate_position_from_box(self, rectangle):
+        return detections
 
-        top_px = np.array([.5*(rectangle[0] + rectangle[2]),rectangle[1]])
-        bottom_px = np.array([.5*(rectangle[0] + rectangle[2]),rectangle[3]])
+    def track_detections(self, camera):
+        # predicted tracks for a frame the detector did not run on
+        return self.trackers[camera].predict()
 
-        r1 = self.direction_to_pixel(top_px)
-        r2 = self.direction_to_pixel(bottom_px)
-
-        h = .078
-
-        l2 = h / ( r1[2]*r2[0] / r1[0] - r2[2] )        
-        p2 = r2*l2
-
-        mount_pos = np.asarray(self.camera_params["position"])
-        mount_rot = np.asarray(self.camera_params["orientation"]).reshape((3,3))
-
-        # self.get_logger().info('Dir: Top=(%s), Bot=(%s)' % (str(r1), str(r2)))
-
-        p2 = np.matmul(mount_rot,p2) + mount_pos
-
-        return p2
+    def publish_objects(self, camera, image, detections):
+        t0 = time.perf_counter()
+        msg = ObjectArray()
+        msg.header.stamp = image.header.stamp
+
+        positions = detections['positions']
+        labels = detections['labels']
+        scores = detections['scores']
+        # tracked cones keep the same uuid over frames
+        ids = detections.get('ids')
+        for b in range(positions.shape[0]):
+            obj = Object()
+            obj.pose.position.x = positions[b, 0]
+            obj.pose.position.y = positions[b, 1]
+            obj.pose.position.z = positions[b, 2]
+            obj.classification.classification = int(labels[b])
+            obj.classification.confidence = float(scores[b])
+            if(ids is not None):
+                obj.uuid.uuid = ids[b]
+            msg.objects.append(obj)
+
+        self.pub_objects[camera].publish(msg)
+        self.timing.record("publish", time.perf_counter() - t0)
 
     # callback to run a loop and publish data this class generates
     def pub_callback(self):
         if(not self.go):
             return
-        msg = ObjectArray()
-
-        boxes = self.prediction['boxes'].detach().cpu().numpy()
-        labels = self.prediction['labels'].detach().cpu().numpy()
-        scores = self.prediction['scores'].detach().cpu().numpy()
-        
-        t0 = time.time()
-
-        #clear old rectangles
-        if(self.vis):
-            [p.remove() for p in self.patches]
-            self.patches.clear()
-            self.ax.texts.clear()
-
-        for b in range(boxes.shape[0]):    
-            if(scores[b] > self.threshold and labels[b]>0):
-                obj = Object()
-
-                position = self.calculate_position_from_box(boxes[b, :].astype(np.float64))
-                obj.pose.position.x = position[0]
-                obj.pose.position.y = position[1]
-                obj.pose.position.z = position[2]
-                obj.classification.classification = int(labels[b])
-                msg.objects.append(obj)
-                
-                if(self.vis):
-                    color = 'r' if int(labels[b])==1 else 'g'
-                    rect = patches.Rectangle((boxes[b, 0], boxes[b, 1]), boxes[b, 2]-boxes[b, 0], boxes[b, 3]-boxes[b,1], linewidth=1, edgecolor=color, facecolor='none')
-                    self.ax.add_patch(rect)
-                    self.patches.append(rect)
-
-                    self.ax.text(boxes[b, 0], boxes[b, 1], "{:.2f}".format(scores[b]), fontsize=8)
-                    self.ax.text(boxes[b, 0], boxes[b, 3], "{:.2f},{:.2f},{:.2f}".format(
-                        position[0],position[1],position[2]), fontsize=8)
-
-        if(self.vis):
-            plt.draw()
-            plt.pause(0.0001)
-            self.counter += 1
-
-        t1 = time.time()    
-        # self.get_logger().info('Displaying Time = %s' % str(t1-t0))
 
-        self.pub_objects.publish(msg)
+        if(self.publish_mode == "timer"):
+            for c in range(self.num_cameras):
+                if(self.results[c] is not None):
+                    image, detections = self.results[c]
+                    self.publish_objects(c, image, detections)
+
+        # only the first camera is visualized
+        if(self.vis and self.results[0] is not None and self.results[0] is not self.vis_pushed):
+            self.push_detections(0)
+
+    def push_detections(self, camera):
+        # hands the raw image and detections to the visualizer process, which decodes and draws them
+        image, detections = self.results[camera]
+        record = {}
+        record['image'] = np.frombuffer(image.data, dtype=np.uint8)
+        record['image_size'] = np.array([image.height, image.width, image.step])
+        record['encoding'] = np.frombuffer(image.encoding.encode(), dtype=np.uint8)
+        for key in ['boxes', 'labels', 'scores', 'positions']:
+            record[key] = detections[key]
+        self.vis_ring.write(record)
+        self.vis_pushed = self.results[camera]
 
 def main(args=None):
     rclpy.init(args=args)
     recognition = ObjectRecognitionNode()
-    rclpy.spin(recognition)
-    recognition.destroy_node()
-    rclpy.shutdown()
+    # also on ctrl-c, so the inference worker stops, the stage latencies are written and
+    # the visualization ring is unlinked
+    try:
+        rclpy.spin(recognition)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        recognition.destroy_node()
+        rclpy.shutdown()
 
 if __name__ == '__main__':
     main()
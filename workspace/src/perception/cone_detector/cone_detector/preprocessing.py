@@ -0,0 +1,110 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import torch
+import numpy as np
+
+# channel count and RGB channel order for the image encodings we receive
+ENCODINGS = {
+    "rgb8": (3, (0, 1, 2)),
+    "rgba8": (4, (0, 1, 2)),
+    "bgr8": (3, (2, 1, 0)),
+    "bgra8": (4, (2, 1, 0)),
+}
+
+class ImagePreprocessor():
+    def __init__(self, device="cpu", dtype=torch.float32):
+        self.device = torch.device(device)
+        self.dtype = dtype
+
+        # network input buffers, reused across frames and keyed by (h,w)
+        self.buffers = {}
+
+        # uint8 staging buffers on the device, only used when device is not the cpu
+        self.staging = {}
+
+    def layout(self, msg):
+        h = msg.height
+        w = msg.width
+        if msg.encoding in ENCODINGS:
+            c, order = ENCODINGS[msg.encoding]
+        else:
+            # unknown encodings are treated as rgb with any extra channels ignored
+            c = msg.step // w if msg.step > 0 else len(msg.data) // (h * w)
+            order = (0, 1, 2)
+        return h, w, c, order
+
+    def wrap(self, msg):
+        # wrap the message buffer as a (h,w,c) uint8 tensor without copying it
+        h, w, c, order = self.layout(msg)
+        step = msg.step if msg.step > 0 else w * c
+        data = torch.frombuffer(msg.data, dtype=torch.uint8, count=h * step)
+        return data.view(h, step)[:, 0:w * c].unflatten(1, (w, c)), order
+
+    def numpy_rgb(self, msg):
+        # zero-copy (h,w,3) rgb view of the message, used for visualization
+        h, w, c, order = self.layout(msg)
+        step = msg.step if msg.step > 0 else w * c
+        data = np.frombuffer(msg.data, dtype=np.uint8, count=h * step)
+        img = data.reshape(h, step)[:, 0:w * c].reshape(h, w, c)
+        if order[0] == 2:
+            return img[:, :, 2::-1]
+        return img[:, :, 0:3]
+
+    def buffer(self, h, w):
+        key = (h, w)
+        if key not in self.buffers:
+            self.buffers[key] = torch.empty((3, h, w), dtype=self.dtype, device=self.device)
+        return self.buffers[key]
+
+    def process(self, msg):
+        # returns a (3,h,w) normalized rgb tensor. The tensor is a reused buffer
+        # that is overwritten by the next call with the same image size
+        return self.normalize(*self.decode(msg))
+
+    def decode(self, msg):
+        # (h,w,c) uint8 view of the message on the device
+        src, order = self.wrap(msg)
+        if self.device.type != "cpu":
+            key = tuple(src.shape)
+            if key not in self.staging:
+                self.staging[key] = torch.empty(key, dtype=torch.uint8, device=self.device)
+            src = self.staging[key].copy_(src)
+        return src, order
+
+    def normalize(self, src, order):
+        h, w = src.shape[0], src.shape[1]
+
+        # channel reorder and uint8 -> float conversion happen in one copy per channel,
+        # scaling is done in place while the channel is still hot in cache
+        out = self.buffer(h, w)
+        for ch in range(3):
+            out[ch].copy_(src[:, :, order[ch]]).div_(255.0)
+        return out
@@ -43,15 +43,18 @@ from typing import List, Tuple, Dict, Optional
 import time
 import os
 import glob
+import inspect
+import contextlib
 import numpy as np
 from PIL import Image
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 
 from loader import *
+from metrics import DetectionMetrics, LossAccumulator
 
 class RecognitionNetwork():
-    def __init__(self):
+    def __init__(self, device=None, build=True, pretrained_backbone=True):
         # network parameters
         num_classes = 3  # background, red cones, green cones
         min_size = 720
@@ -60,8 +63,17 @@ class RecognitionNetwork():
         box_detections_per_img = 100
         trainable_layers = 0
         pretrained = False
-        pretrained_backbone = True
         self.device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        if(device is not None):
+            self.device = torch.device(device)
+
+        # scripted models (e.g. quantized ones) return (losses, detections) instead of detections
+        self.scripted = False
+
+        # the network is not built when a scripted model is loaded in its place
+        if(not build):
+            self.model = None
+            return
 
         #fasterrcnn_mobilenet_v3_large_fpn
         #fasterrcnn_mobilenet_v3_large_320_fpn
@@ -79,200 +91,250 @@ class RecognitionNetwork():
         # self.model.transform = DummyTransform(720,1280,(0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
         self.model.eval().to(self.device)
 
+    def set_input_size(self, w, h):
+        # images are resized to exactly (w,h) before the backbone and boxes are mapped back to the input size
+        self.model.transform.fixed_size = (int(w), int(h))
+
     def predict(self, imgs):
+        if(self.scripted):
+            return self.model(imgs)[1]
         return self.model(imgs)
 
-    def train_single_epoch(self, train_loader, opt, accumulation_step):
+    def time_inference(self, data_loader, samples):
+        # average seconds per image over up to samples images
+        self.eval()
+        total_time = 0
+        total_imgs = 0
+        with torch.no_grad():
+            for i, data in enumerate(data_loader):
+                batch = DetectionBatch.from_data(data).to(self.device)
+                img_list, target_list = self.split_batch(batch.imgs, batch.boxes(), batch.labels(), batch.counts)
+
+                t0 = time.time()
+                self.predict(img_list)
+                total_time += time.time() - t0
+                total_imgs += len(img_list)
+
+                if(total_imgs >= samples):
+                    break
+        return total_time / max(total_imgs, 1)
+
+    def quantize(self, calibration_loader, samples=100, engine="fbgemm"):
+        # post-training static int8 quantization of the backbone and fpn. The rpn and
+        # box heads stay in fp32. Quantized models only run on the cpu. Build the network
+        # with pretrained_backbone=False: the frozen batch norms of a pretrained backbone are
+        # not fused into the convolutions and leave every int8 conv between fp32 ops
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+
+        torch.backends.quantized.engine = engine
+        self.device = torch.device("cpu")
+        self.eval()
+
+        min_size, max_size = self.model.transform.min_size[0], self.model.transform.max_size
+        example_inputs = (torch.rand((1, 3, min_size, max_size)),)
+        self.model.backbone = prepare_fx(self.model.backbone, get_default_qconfig_mapping(engine), example_inputs)
+
+        # calibrate the observers on real images
+        print("Calibrating quantization on {} images".format(samples))
+        calibrated = 0
+        with torch.no_grad():
+            for i, data in enumerate(calibration_loader):
+                batch = DetectionBatch.from_data(data)
+                img_list, target_list = self.split_batch(batch.imgs, batch.boxes(), batch.labels(), batch.counts)
+                self.predict(img_list)
+                calibrated += len(batch)
+                if(calibrated >= samples):
+                    break
+
+        self.model.backbone = convert_fx(self.model.backbone)
+        print("Quantized backbone to int8")
+
+    def split_batch(self, imgs, boxes, labels, counts):
+        # float images and the target dict of each image of a batch with ragged targets,
+        # leaving out boxes without a label
+        if(imgs.dtype == torch.uint8):
+            imgs = imgs.float() / 255.0
+        target_list = []
+        for b_boxes, b_labels in zip(torch.split(boxes, counts), torch.split(labels, counts)):
+            ids = b_labels > 0
+            target_list.append({"boxes": b_boxes[ids], "labels": b_labels[ids]})
+        return list(imgs.unbind(0)), target_list
+
+    def autocast_backbone(self, precision):
+        # runs the backbone and fpn under autocast through hooks, returning fp32 features.
+        # The rpn and box heads stay in fp32, in bf16 a 1280 pixel coordinate is only
+        # resolved to 8 pixels and the boxes of small cones collapse. Returns the hook
+        # handles to remove
+        if(precision == "fp32"):
+            return []
+        autocast = torch.autocast(torch.device(self.device).type, dtype=torch.bfloat16 if precision == "bf16" else torch.float16)
+
+        def enter(module, inputs):
+            autocast.__enter__()
+
+        def exit(module, inputs, outputs):
+            autocast.__exit__(None, None, None)
+            return type(outputs)((k, v.float()) for k, v in outputs.items())
+
+        return [self.model.backbone.register_forward_pre_hook(enter), self.model.backbone.register_forward_hook(exit)]
+
+    def gather_ranks(self, value):
+        # the value of every rank of a distributed run, only this value otherwise
+        if(not (torch.distributed.is_available() and torch.distributed.is_initialized())):
+            return [value]
+        values = [None for r in range(torch.distributed.get_world_size())]
+        torch.distributed.all_gather_object(values, value)
+        return values
+
+    def merge_ranks(self, accumulator):
+        # a LossAccumulator or DetectionMetrics combined over all ranks
+        accumulators = self.gather_ranks(accumulator)
+        merged = accumulators[0]
+        for a in accumulators[1:]:
+            merged.merge(a)
+        return merged
+
+    def train_single_epoch(self, train_loader, opt, accumulation_step, augmentation=None, scaler=None, model=None):
+        # returns the losses and the number of trained images, losses are scaled when a
+        # GradScaler is given. model is the DistributedDataParallel wrapper in distributed runs
+        model = self.model if model is None else model
         opt.zero_grad()
 
-        epoch_loss_total = 0
+        losses_total = LossAccumulator()
+        images = 0
 
         for i, data in enumerate(train_loader):
-            imgs, boxes, labels = data
+            # one copy of the images and one of the targets per batch
+            batch = DetectionBatch.from_data(data).to(self.device)
+            imgs, boxes, labels = batch.imgs, batch.boxes(), batch.labels()
+            if(augmentation is not None):
+                imgs, boxes, labels = augmentation(imgs, boxes, labels, batch.counts)
 
             # prep the batch
-            img_list = []
-            target_list = []
-            for b in range(imgs.size()[0]):
-                img_tensor = imgs[b, :, :, :].to(self.device)
-                target_dict = {}
-                ids = labels[b, :] > 0
-                target_dict["boxes"] = boxes[b, ids, :].to(self.device)
-                target_dict["labels"] = labels[b, ids].to(self.device)
-                img_list.append(img_tensor)
-                target_list.append(target_dict)
-
-            loss_dict = self.model(img_list, target_list)
-            # print("loss_dict=",loss_dict)
-            losses = sum(loss for loss in loss_dict.values())
-            epoch_loss_total += losses.item()
-
-            losses.backward()
-            if((i + 1) % accumulation_step == 0):
-                opt.step()
+            img_list, target_list = self.split_batch(imgs, boxes, labels, batch.counts)
+
+            # gradients are only all-reduced between ranks for the batches that step
+            step = (i + 1) % accumulation_step == 0
+            with (model.no_sync() if(not step and hasattr(model, "no_sync")) else contextlib.nullcontext()):
+                loss_dict = model(img_list, target_list)
+                # print("loss_dict=",loss_dict)
+                losses = sum(loss for loss in loss_dict.values())
+                losses_total.add(loss_dict)
+                images += len(img_list)
+
+                if(scaler is not None):
+                    scaler.scale(losses).backward()
+                else:
+                    losses.backward()
+            if(step):
+                if(scaler is not None):
+                    scaler.step(opt)
+                    scaler.update()
+                else:
+                    opt.step()
                 opt.zero_grad()
         
-        return epoch_loss_total
+        return losses_total, images
 
-    def eval_dataset(self, val_loader):
-        val_loss_total = 0
-
-        for i, data in enumerate(val_loader):
-            imgs, boxes, labels = data
-            # prep the batch
-            img_list = []
-            target_list = []
-            for b in range(imgs.size()[0]):
-                img_tensor = imgs[b, :, :, :].to(self.device)
-                target_dict = {}
-                ids = labels[b, :] > 0
-                # print("nonzero classes=",ids)
-                target_dict["boxes"] = boxes[b, ids, :].to(self.device)
-                target_dict["labels"] = labels[b, ids].to(self.device)
-                img_list.append(img_tensor)
-                target_list.append(target_dict)
-
-
-            # fig, ax = plt.subplots()
-            # ax.imshow(img_list[0].cpu().numpy().transpose((1, 2, 0)))
-            # for b in boxes[0,labels[0,:]>0,:]:
-            #     rect = patches.Rectangle(
-            #         (b[0], b[1]), b[2]-b[0], b[3]-b[1], linewidth=1, edgecolor='b', facecolor='none')
-            #     ax.add_patch(rect)
-            # plt.show()
-
-            vloss_dict = self.model(img_list, target_list)
-            vlosses = sum(loss for loss in vloss_dict.values())
-            val_loss_total += vlosses.item()
-        return val_loss_total
-
-    def evaluate_iou(self, data_loader, samples):
+    def eval_dataset(self, val_loader, samples=-1, matching="greedy"):
+        # one pass over up to samples batches that collects both the losses and the detection
+        # metrics. The backbone runs once per batch, only the heads run in training mode for
+        # the losses and again in eval mode for the detections
+        self.eval()
+        model = self.model
+
+        losses_total = LossAccumulator()
+        metrics = DetectionMetrics(matching=matching)
+        with torch.no_grad():
+            for i, data in enumerate(val_loader):
+                if(samples >= 0 and i >= samples):
+                    break
+                cpu_batch = DetectionBatch.from_data(data)
+                batch = cpu_batch.to(self.device)
+                # prep the batch
+                img_list, target_list = self.split_batch(batch.imgs, batch.boxes(), batch.labels(), batch.counts)
+
+                original_sizes = [img.shape[-2:] for img in img_list]
+                images, targets = model.transform(img_list, target_list)
+                features = model.backbone(images.tensors)
+
+                model.rpn.training = True
+                model.roi_heads.training = True
+                proposals, rpn_losses = model.rpn(images, features, targets)
+                detections, detector_losses = model.roi_heads(features, proposals, images.image_sizes, targets)
+                model.rpn.training = False
+                model.roi_heads.training = False
+                losses_total.add({**rpn_losses, **detector_losses})
+
+                proposals, _ = model.rpn(images, features)
+                detections, _ = model.roi_heads(features, proposals, images.image_sizes)
+                detections = model.transform.postprocess(detections, images.image_sizes, original_sizes)
+
+                # ground truth from the batch on the cpu
+                gt_targets = torch.split(cpu_batch.targets, cpu_batch.counts)
+                for b in range(len(batch)):
+                    metrics.add(detections[b]["boxes"].cpu().numpy(), detections[b]["labels"].cpu().numpy(),
+                                detections[b]["scores"].cpu().numpy(), gt_targets[b][:,1:5].numpy(), gt_targets[b][:,0].numpy())
+
+        return losses_total, metrics
+
+    def evaluate(self, data_loader, samples, matching="greedy"):
+        # detection metrics (see metrics.DetectionMetrics) over up to samples batches
         self.eval()
 
-        iou_list = []
-        for i, data in enumerate(data_loader):
-            imgs, boxes, labels = data
-            self.h = imgs[0].size()[1]
-            self.w = imgs[0].size()[2]
-
-            img_list = []
-            target_list = []
-            for b in range(imgs.size()[0]):
-                img_tensor = imgs[b, :, :, :].to(self.device)
-                target_dict = {}
-                ids = labels[b, :] > 0
-                target_dict["boxes"] = boxes[b, ids, :].to(self.device)
-                target_dict["labels"] = labels[b, ids].to(self.device)
-                img_list.append(img_tensor)
-                target_list.append(target_dict)
-
-            prediction = self.predict(img_list)
-
-            #DEBUG INFO
-            # fig, ax = plt.subplots()
-            # gt_boxes = target_list[0]["boxes"].cpu().detach().numpy()
-            # gt_labels = target_list[0]["labels"].cpu().detach().numpy()
-            # pred_boxes = prediction[0]["boxes"].cpu().detach().numpy()
-            # pred_labels = prediction[0]["labels"].cpu().detach().numpy()
-
-            # ax.imshow(img_list[0].cpu().detach().numpy().transpose((1,2,0)))
-            # for b in range(gt_boxes.shape[0]):    
-            #     color = 'b'
-            #     rect = patches.Rectangle((gt_boxes[b, 0], gt_boxes[b, 1]), gt_boxes[b, 2]-gt_boxes[b, 0], gt_boxes[b, 3]-gt_boxes[b,1], linewidth=2, edgecolor=color, facecolor='none')
-            #     ax.add_patch(rect)
-
-            # for b in range(pred_boxes.shape[0]):    
-            #     color = 'r' if int(pred_labels[b])==1 else 'g'
-            #     rect = patches.Rectangle((pred_boxes[b, 0], pred_boxes[b, 1]), pred_boxes[b, 2]-pred_boxes[b, 0], pred_boxes[b, 3]-pred_boxes[b,1], linewidth=2, edgecolor=color, facecolor='none')
-            #     ax.add_patch(rect)
-            # plt.show()
-
-            #perform box matching for each class
-            gt_boxes = target_list[0]["boxes"].cpu().detach().numpy()
-            gt_labels = target_list[0]["labels"].cpu().detach().numpy()
-            pred_boxes = prediction[0]["boxes"].cpu().detach().numpy()
-            pred_labels = prediction[0]["labels"].cpu().detach().numpy()
-
-            # do matching on all classes together to include mislabeling in error metrics 
-            gt_boxes = gt_boxes[gt_labels>0]
-            gt_labels = gt_labels[gt_labels>0]
-            pred_boxes = pred_boxes[pred_labels>0]
-            pred_labels = pred_labels[pred_labels>0]
-
-            iou_matrix = np.zeros((len(pred_labels),len(gt_labels)))
-
-            #calculate iou for predicted box vs each gt box
-            for p in range(len(pred_labels)):
-                for g in range(len(gt_labels)):
-                    gx0,gy0,gx1,gy1 = gt_boxes[g,:].astype(np.int32)
-                    px0,py0,px1,py1 = pred_boxes[p,:].astype(np.int32)
-
-                    #do mask comparison
-                    mask = np.zeros((self.w,self.h)).astype(np.int32)
-                    mask[gx0:gx1,gy0:gy1] += 1
-                    mask[px0:px1,py0:py1] += 1
-
-                    intersection = np.count_nonzero(mask[mask==2])
-                    union = np.count_nonzero(mask[mask>0])
-
-                    iou_matrix[p,g] = intersection / float(union)
-
-            #greedily find the max IOU to match boxes
-            pairs = []
-
-            gt_ids = list(range(len(gt_labels)))
-            pred_ids = list(range(len(pred_labels)))
-            
-            if(len(pred_labels) > 0 and len(gt_labels) > 0):
-                for p in range(len(pred_labels)):
-                    if(np.max(iou_matrix) < 1e-9):
-                        break
-
-                    id_max = np.unravel_index(iou_matrix.argmax(), iou_matrix.shape)
-                    pairs.append(id_max)
-                    pred_ids.remove(id_max[0])
-                    gt_ids.remove(id_max[1])
-                    #zero out the row and column selected
-                    iou_matrix[id_max[0],:] = -1
-                    iou_matrix[:,id_max[1]] = -1
-
-            #handle any remaining predictions or gt boxes with no pairs
-            for p in pred_ids:
-                pairs.append((p,-1))
-            for g in gt_ids:
-                pairs.append((-1,g))      
-
-            for p,pair in enumerate(pairs):
-                iou = 0
-                p_id = pair[0]
-                g_id = pair[1]
-                if(p_id >= 0 and g_id >= 0):
-                    mask = np.zeros((self.w,self.h)).astype(np.int32)
-                    mask[gx0:gx1,gy0:gy1] += 1
-                    mask[px0:px1,py0:py1] += 1
-
-                    intersection = np.count_nonzero(mask[mask==2])
-                    union = np.count_nonzero(mask[mask>0])
-                    iou = intersection / union
-                iou_list.append(iou)
-
-            if(i >= samples):
-                break
-                # print("IOU:",iou_list)
-                # return np.mean(iou_list)
-
-        # print("IOU:",iou_list)
-        return np.mean(iou_list)
-
-    def train(self, train_loader, val_loader, epochs=1, lr=.001, use_scheduler=False, accumulation_step=4, scheduler_step=1, output_path="output", save_interval=10):
+        metrics = DetectionMetrics(matching=matching)
+        with torch.no_grad():
+            for i, data in enumerate(data_loader):
+                cpu_batch = DetectionBatch.from_data(data)
+                batch = cpu_batch.to(self.device)
+                img_list, target_list = self.split_batch(batch.imgs, batch.boxes(), batch.labels(), batch.counts)
+
+                prediction = self.predict(img_list)
+
+                gt_targets = torch.split(cpu_batch.targets, cpu_batch.counts)
+                for b in range(len(batch)):
+                    metrics.add(prediction[b]["boxes"].cpu().numpy(), prediction[b]["labels"].cpu().numpy(),
+                                prediction[b]["scores"].cpu().numpy(), gt_targets[b][:,1:5].numpy(), gt_targets[b][:,0].numpy())
+
+                if(i >= samples):
+                    break
+
+        return metrics
+
+    def evaluate_iou(self, data_loader, samples, matching="greedy"):
+        return self.evaluate(data_loader, samples, matching).mean_iou()
+
+    def train(self, train_loader, val_loader, epochs=1, lr=.001, use_scheduler=False, accumulation_step=4, scheduler_step=1, output_path="output", save_interval=10, eval_interval=1, eval_samples=-1, augmentation=None, precision="fp32", channels_last=False):
         self.model.train()
         if(not os.path.exists(output_path)):
             os.mkdir(output_path)
 
+        # activations follow the memory format of the conv weights
+        if(channels_last):
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+        # in a distributed run gradients are averaged over the ranks, every rank trains on
+        # its share of the batches and only rank 0 logs and saves
+        distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+        main_rank = not distributed or torch.distributed.get_rank() == 0
+        model = nn.parallel.DistributedDataParallel(self.model) if distributed else self.model
+
         params = [p for p in self.model.parameters() if p.requires_grad]
         opt = optim.Adam(params, lr=lr)
         scheduler = optim.lr_scheduler.ExponentialLR(opt, gamma=0.9)
 
+        # the backbone runs in bf16 or fp16 (see autocast_backbone). fp16 gradients can
+        # underflow, bf16 has the exponent range of fp32 and needs no scaling
+        scaler = None
+        if(precision == "fp16"):
+            scaler = torch.amp.GradScaler(torch.device(self.device).type)
+        if(main_rank):
+            print("Training in {}{}{}".format(precision, ", channels last" if channels_last else "",
+                                              ", {} ranks".format(torch.distributed.get_world_size()) if distributed else ""))
+        total_images = 0
+        total_time = 0.0
+
         validation_samples = 2000
         output_samples = 100
 
@@ -280,22 +342,45 @@ class RecognitionNetwork():
             val_loader = train_loader
 
         for e in range(epochs):
+            t0 = time.time()
             self.model.train()
-            train_loss_total = self.train_single_epoch(train_loader, opt, accumulation_step)
+            # a different shuffle of the rank shares every epoch
+            if(hasattr(train_loader.sampler, "set_epoch")):
+                train_loader.sampler.set_epoch(e)
+            hooks = self.autocast_backbone(precision)
+            train_losses, images = self.train_single_epoch(train_loader, opt, accumulation_step, augmentation, scaler, model)
+            for h in hooks:
+                h.remove()
             if(use_scheduler and (e+1) % scheduler_step == 0):
                 scheduler.step()
-
-            val_loss_total = self.eval_dataset(val_loader)
-
-            train_iou = self.evaluate_iou(train_loader, len(val_loader))
-            val_iou = self.evaluate_iou(val_loader, len(val_loader))
-
-
-            print("Epoch [{}/{}], Lr [{:.6f}], Train Loss [{:.4f}], Val loss [{:.4f}, Train IOU [{:.4f}], Val IOU [{:.4f}]".format(e+1, epochs, scheduler.get_last_lr()[0],
-                                                                                     train_loss_total / len(train_loader),
-                                                                                     val_loss_total / len(val_loader),
-                                                                                     train_iou, val_iou))
-            if((e+1) % save_interval == 0):
+            train_losses = self.merge_ranks(train_losses)
+            images = sum(self.gather_ranks(images))
+            t1 = time.time()
+            total_images += images
+            total_time += t1 - t0
+
+            # validate every eval_interval epochs and after the last one, on up to eval_samples batches
+            if((e+1) % eval_interval != 0 and e+1 != epochs):
+                if(main_rank):
+                    print("Epoch [{}/{}], Lr [{:.6f}], Train Loss [{:.4f}], Time [{:.1f} s, {:.1f} imgs/s]".format(e+1, epochs, scheduler.get_last_lr()[0],
+                                                                                     train_losses.mean(), t1-t0, images/(t1-t0)))
+                if((e+1) % save_interval == 0 and main_rank):
+                    self.save(output_path)
+                continue
+
+            val_losses, val_metrics = self.eval_dataset(val_loader, eval_samples)
+            val_losses = self.merge_ranks(val_losses)
+            val_metrics = self.merge_ranks(val_metrics)
+            val_summary = val_metrics.summary()
+            t2 = time.time()
+
+            if(main_rank):
+                print("Epoch [{}/{}], Lr [{:.6f}], Train Loss [{:.4f}], Val loss [{:.4f}], Val IOU [{:.4f}], Val mAP [{:.4f}], Time [{:.1f} s train, {:.1f} s val, {:.1f} imgs/s]".format(e+1, epochs, scheduler.get_last_lr()[0],
+                                                                                     train_losses.mean(),
+                                                                                     val_losses.mean(),
+                                                                                     val_summary['mean_iou'], val_summary['map'],
+                                                                                     t1-t0, t2-t1, images/(t1-t0)))
+            if((e+1) % save_interval == 0 and main_rank):
                 self.save(output_path)
             # # get an example prediction and show it after each epoch
             # if((e+1) % display_interval == 0):
@@ -355,6 +440,11 @@ class RecognitionNetwork():
             #         if(i >= output_samples):
             #             break
 
+        # the last epoch is always validated
+        if(epochs > 0 and main_rank):
+            print("Trained in {}{} at {:.1f} imgs/s, final Val IOU [{:.4f}]".format(precision, ", channels last" if channels_last else "",
+                                                                                total_images/total_time, val_summary['mean_iou']))
+
     def load(self, path):
         self.model.load_state_dict(torch.load(path,map_location=self.device))
         print("Loaded pretrained model at {}".format(path))
@@ -365,49 +455,46 @@ class RecognitionNetwork():
 
         torch.save(self.model.state_dict(), os.path.join(output_dir,model_name))
 
-    def export(self,output_path="output",name="model.onnx",w=1280,h=720):
-        print("Starting export to onnx")
-        # if(not os.path.exists(output_path)):
-        #     os.mkdir(output_path)
-
-
-        # # print(self.model)
-        # # print(type(self.model))
-
-        
-        # self.model.cpu()
-        # self.model.train()
-
-        # # del self.model.transform
-
-        # #dry run for size
-        # x = torch.randn(1,3,h,w).cpu()
-        # self.eval()
-        # self.model.cpu()
-
-
-
-        # tmp_model = self.model
-
-
-        # # print(tmp_model.transform)
-
-        # tr = torch.nn.Sequential(
-        #     transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225)),
-        # )
+    def save_scripted(self, path, freeze=False):
+        # saves the model with its precision and weights applied as torchscript. Frozen
+        # models load and run faster but are inference only, the input size stays settable
+        self.eval()
+        model = self.model if self.scripted else torch.jit.script(self.model)
+        if(freeze):
+            model = torch.jit.freeze(model.eval(), preserved_attrs=["transform.fixed_size"])
+        torch.jit.save(model, path)
+        print("Saved scripted model at {}".format(path))
 
-        # tmp_model.transform = DummyTransform(720,1280,(0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
-        # p = tmp_model(x)
-        # print(tmp_model)
+    def load_scripted(self, path):
+        self.model = torch.jit.load(path, map_location=self.device)
+        self.scripted = True
+        print("Loaded scripted model at {}".format(path))
 
+    def export(self,output_path="output",name="model.onnx",w=1280,h=720):
+        print("Starting export to onnx")
+        if(not os.path.exists(output_path)):
+            os.mkdir(output_path)
 
-        # # Export the model
-        # torch.onnx.export(tmp_model,               # model being run
-        #           x,                         # model input (or a tuple for multiple inputs)
-        #           os.path.join(output_path,name),   # where to save the model (can be a file or file-like object)
-        #           export_params=True,        # store the trained parameter weights inside the model file
-        #           opset_version=11,          # the ONNX version to export the model to
-        #           do_constant_folding=False,  # whether to execute constant folding for optimization
-        #           input_names = ['input'],   # the model's input names
-        #           output_names = ['output'])  # the model's output names)
-        # print("Model exported to onnx")
\ No newline at end of file
+        # export from the cpu in fp32, the fixed size transform is traced into the graph
+        self.device = torch.device("cpu")
+        self.eval()
+        self.model.float()
+
+        x = torch.rand((3,h,w))
+
+        kwargs = {}
+        if("dynamo" in inspect.signature(torch.onnx.export).parameters):
+            kwargs["dynamo"] = False  # detection models only export through the torchscript exporter
+
+        # Export the model
+        torch.onnx.export(self.model,               # model being run
+                  ([x],),                    # model input, a list with a single image
+                  os.path.join(output_path,name),   # where to save the model (can be a file or file-like object)
+                  export_params=True,        # store the trained parameter weights inside the model file
+                  opset_version=11,          # the ONNX version to export the model to
+                  do_constant_folding=True,  # whether to execute constant folding for optimization
+                  input_names = ['input'],   # the model's input names
+                  output_names = ['boxes', 'labels', 'scores'], # the model's output names
+                  **kwargs)
+        print("Model exported to onnx")
+        return os.path.join(output_path,name)
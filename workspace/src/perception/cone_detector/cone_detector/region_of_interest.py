@@ -0,0 +1,76 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+
+# horizontal band of the image where cones on the ground can appear. Rows above the
+# top of a cone at max_range (which is always below the horizon for a camera mounted
+# above the cones) are cropped away before inference.
+class GroundRegionOfInterest():
+    def __init__(self, camera_model, max_range=10.0, ground_height=0.0, object_height=.078, margin=8):
+        self.width = camera_model.width
+        self.height = camera_model.height
+
+        # tangent of the elevation angle of each pixel's ray in the vehicle frame,
+        # taking the highest pixel in each row so a rolled camera is handled too
+        rays = np.matmul(np.asarray(camera_model.rays, dtype=np.float64), camera_model.rotation.T)
+        tan_elevation = rays[:,:,2] / np.linalg.norm(rays[:,:,0:2], axis=2)
+        row_elevation = np.max(tan_elevation, axis=1)
+
+        # rows are ordered top to bottom, so elevation decreases with the row index
+        self.horizon_row = self.first_row_below(row_elevation, 0.0)
+
+        camera_height = camera_model.position[2] - ground_height
+        max_elevation = (object_height - camera_height) / max_range
+        self.top = max(self.first_row_below(row_elevation, max_elevation) - margin, 0)
+        self.bottom = self.height
+
+    def first_row_below(self, row_elevation, tan_elevation):
+        rows = np.nonzero(row_elevation <= tan_elevation)[0]
+        return int(rows[0]) if len(rows) > 0 else self.height
+
+    def extend_to(self, rows):
+        # grow the band upwards so it is rows tall, used to give multiple cameras the same size
+        self.top = max(self.bottom - rows, 0)
+
+    def size(self):
+        return self.width, self.bottom - self.top
+
+    def crop(self, img):
+        # (3,h,w) image -> view of the band
+        return img[:, self.top:self.bottom, :]
+
+    def uncrop(self, prediction):
+        # map boxes from band coordinates back to full frame coordinates
+        boxes = prediction['boxes'].clone()
+        boxes[:, 1] += self.top
+        boxes[:, 3] += self.top
+        prediction['boxes'] = boxes
+        return prediction
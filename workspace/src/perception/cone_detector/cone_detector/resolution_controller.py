@@ -0,0 +1,92 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import numpy as np
+from collections import deque
+
+# picks the largest input scale whose rolling inference latency stays under a budget.
+# Latency at scales that have not been measured recently is estimated from the current
+# scale assuming it grows with the number of pixels, so larger scales get retried when
+# the load on the machine drops.
+class ResolutionController():
+    def __init__(self, scales, budget, window=20, min_samples=5, expire=200):
+        self.scales = sorted(scales, reverse=True)
+        self.budget = budget
+        self.min_samples = min_samples
+        self.expire = expire
+        self.latencies = [deque(maxlen=window) for s in self.scales]
+        self.last_measured = [0 for s in self.scales]
+        self.frames = 0
+
+        # start at the largest scale
+        self.index = 0
+        self.samples_since_change = 0
+
+    def scale(self):
+        return self.scales[self.index]
+
+    def latency(self, index=None):
+        # rolling latency at a scale, None if it has not been measured enough
+        index = self.index if index is None else index
+        if(len(self.latencies[index]) < self.min_samples):
+            return None
+        if(index != self.index and self.frames - self.last_measured[index] > self.expire):
+            return None
+        return float(np.mean(self.latencies[index]))
+
+    def estimate(self, index):
+        latency = self.latency(index)
+        if(latency is not None):
+            return latency
+        return self.latency() * (self.scales[index] / self.scale())**2
+
+    def record(self, latency):
+        # adds an inference latency at the current scale, returns True if the scale changed
+        self.latencies[self.index].append(latency)
+        self.frames += 1
+        self.last_measured[self.index] = self.frames
+        self.samples_since_change += 1
+        if(self.samples_since_change < self.min_samples):
+            return False
+
+        index = len(self.scales) - 1
+        for i in range(len(self.scales)):
+            if(self.estimate(i) <= self.budget):
+                index = i
+                break
+
+        if(index == self.index):
+            return False
+
+        # start a fresh window at the new scale, old measurements there may be stale
+        self.latencies[index].clear()
+        self.index = index
+        self.samples_since_change = 0
+        return True
@@ -0,0 +1,122 @@
+#
+# BSD 3-Clause License
+#
+# Copyright (c) 2022 University of Wisconsin - Madison
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+#
+# * Redistributions of source code must retain the above copyright notice, this
+#   list of conditions and the following disclaimer.
+#
+# * Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+#
+# * Neither the name of the copyright holder nor the names of its
+#   contributors may be used to endorse or promote products derived from
+#   this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE
+# DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE
+# FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL
+# DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR
+# SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER
+# CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY,
+# OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
+import math
+import json
+import os
+import threading
+
+import numpy as np
+
+# Fixed memory latency histogram in the spirit of HdrHistogram: buckets are spaced
+# logarithmically so every recorded value is kept to a relative precision, no matter
+# how many values are recorded.
+class LatencyHistogram():
+    def __init__(self, lowest=1e-6, highest=100.0, precision=0.01):
+        self.lowest = lowest
+        self.highest = highest
+        self.log_base = math.log1p(precision)
+        # bucket 0 holds values up to lowest, the last bucket everything above highest
+        self.last = int(math.log(highest / lowest) / self.log_base) + 2
+        self.counts = np.zeros(self.last + 1, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def index(self, value):
+        if(value <= self.lowest):
+            return 0
+        return min(int(math.log(value / self.lowest) / self.log_base) + 1, self.last)
+
+    def bucket_value(self, index):
+        # upper edge of a bucket
+        return self.lowest * math.exp(index * self.log_base)
+
+    def record(self, value):
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, p):
+        if(self.count == 0):
+            return float('nan')
+        rank = max(1, math.ceil(p / 100.0 * self.count))
+        index = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self.bucket_value(index), self.max)
+
+    def reset(self):
+        self.counts[:] = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count > 0 else float('nan'),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'max': self.max,
+        }
+
+# one histogram per pipeline stage, values in seconds. Stages may be recorded from
+# several threads
+class StageTimer():
+    def __init__(self, stages, **histogram_args):
+        self.stages = list(stages)
+        self.histograms = dict((s, LatencyHistogram(**histogram_args)) for s in self.stages)
+        self.lock = threading.Lock()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.histograms[stage].record(seconds)
+
+    def summary(self):
+        with self.lock:
+            return dict((s, self.histograms[s].summary()) for s in self.stages)
+
+    def dump(self, path):
+        # summary and the non empty buckets of every stage as json
+        path = os.path.expanduser(path)
+        result = {}
+        with self.lock:
+            for s in self.stages:
+                h = self.histograms[s]
+                nonzero = np.nonzero(h.counts)[0]
+                result[s] = h.summary()
+                result[s]['buckets'] = [[h.bucket_value(int(i)), int(h.counts[i])] for i in nonzero]
+
+        directory = os.path.dirname(path)
+        if(directory != "" and not os.path.exists(directory)):
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(result, f, indent=2)
@@ -29,9 +29,11 @@
 # OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
 # OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.#
 import time
+import numpy as np
 from recognition_network import *
 from loader import *
 from metrics import *
+from augmentation import BatchAugmentation
 import argparse
 import sys
 
@@ -40,41 +42,218 @@ def generate_boxes(args):
     train_dataset = SegImgLoader(data_root=args.training_path,
                                  max_samples=args.n_train)
 
-    train_dataset.GenerateAAVBBFromSeg()
+    train_dataset.GenerateAAVBBFromSeg(processes=args.threads, regenerate=args.regenerate_labels)
 
 
-def train(args):
+def pack(args):
+    # decode the training and validation sets once into memory mapped shards
+    for path in [args.training_path, args.validation_path]:
+        dataset = ObjectDetectionImgLoader(data_root=path, max_boxes=args.max_boxes,
+                                           max_samples=-1,apply_transforms=False)
+        dataset.Pack(os.path.join(path, "packed"), shard_size=args.shard_size, processes=args.threads)
+
+def load_dataset(args, data_root, max_samples, apply_transforms, uint8_images=False):
+    # samples only carry their labeled boxes, batched by collate_detections
+    if(args.packed):
+        return PackedDetectionLoader(data_root=data_root, max_boxes=args.max_boxes, max_samples=max_samples,
+                                     apply_transforms=apply_transforms, uint8_images=uint8_images, ragged=True)
+    return ObjectDetectionImgLoader(data_root=data_root, max_boxes=args.max_boxes, max_samples=max_samples,
+                                    apply_transforms=apply_transforms, uint8_images=uint8_images, ragged=True)
+
+def make_loader(args, dataset, batch_size, shuffle, drop_last=False):
+    # batches are pinned so they go to the gpu with non-blocking copies. In a distributed
+    # run every rank loads its own share of the dataset
+    sampler = None
+    if(torch.distributed.is_available() and torch.distributed.is_initialized()):
+        sampler = torch.utils.data.distributed.DistributedSampler(dataset, shuffle=shuffle, drop_last=drop_last)
+        shuffle = False
+    return torch.utils.data.DataLoader(dataset, batch_size, shuffle=shuffle, sampler=sampler, num_workers=args.threads, drop_last=drop_last,
+                                       collate_fn=collate_detections, pin_memory=torch.cuda.is_available())
+
+def init_distributed(args, rank=None):
+    # joins the process group of a distributed run, started either by torchrun (which sets
+    # RANK, WORLD_SIZE, MASTER_ADDR and MASTER_PORT) or by --nprocs. Returns the rank
+    if(rank is not None):
+        os.environ.setdefault("MASTER_ADDR", "127.0.0.1")
+        os.environ.setdefault("MASTER_PORT", str(args.master_port))
+        world_size = args.nprocs
+        # the local ranks share the cores
+        torch.set_num_threads(max(1, torch.get_num_threads() // args.nprocs))
+    elif(int(os.environ.get("WORLD_SIZE", 1)) > 1):
+        rank = int(os.environ["RANK"])
+        world_size = int(os.environ["WORLD_SIZE"])
+    else:
+        return 0
+
+    torch.distributed.init_process_group(args.dist_backend, rank=rank, world_size=world_size)
+    if(torch.cuda.is_available()):
+        torch.cuda.set_device(int(os.environ.get("LOCAL_RANK", rank)) % torch.cuda.device_count())
+    return rank
+
+def train(args, rank=None):
     # run training as requested
-    print("=== Loading Datasets ===")
+    rank = init_distributed(args, rank)
+    if(rank == 0):
+        print("=== Loading Datasets ===")
 
-    train_dataset = ObjectDetectionImgLoader(data_root=args.training_path, max_boxes=args.max_boxes,
-                                             max_samples=args.n_train,apply_transforms=True)
-    val_dataset = ObjectDetectionImgLoader(data_root=args.validation_path, max_boxes=args.max_boxes,
-                                           max_samples=args.n_val,apply_transforms=False)
+    # training images stay uint8 until the whole batch is augmented on the training device
+    train_dataset = load_dataset(args, args.training_path, args.n_train, apply_transforms=False, uint8_images=True)
+    val_dataset = load_dataset(args, args.validation_path, args.n_val, apply_transforms=False)
 
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset, args.batch_size, shuffle=True, num_workers=args.threads, drop_last=True)
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset, args.batch_size, shuffle=True, num_workers=args.threads, drop_last=True)
+    train_loader = make_loader(args, train_dataset, args.batch_size, shuffle=True, drop_last=True)
+    val_loader = make_loader(args, val_dataset, args.batch_size, shuffle=True, drop_last=True)
 
-    print("=== Training ===")
+    if(rank == 0):
+        print("=== Training ===")
 
-    model = RecognitionNetwork()
+    device = None
+    if(torch.cuda.is_available()):
+        device = torch.device("cuda", torch.cuda.current_device())
+    model = RecognitionNetwork(device)
     if(os.path.exists(args.input_model)):
         model.load(args.input_model)
+    # every rank augments its shard with its own sequence
+    augmentation = BatchAugmentation(seed=None if args.augmentation_seed < 0 else args.augmentation_seed + rank)
     model.train(train_loader, val_loader, epochs=args.epochs,
                 lr=args.learning_rate, use_scheduler=args.use_scheduler,
                 accumulation_step=args.acc_step, scheduler_step=args.sched_step,
-                output_path=args.output_path, save_interval=args.save_interval)
+                output_path=args.output_path, save_interval=args.save_interval,
+                eval_interval=args.eval_interval, eval_samples=args.eval_samples,
+                augmentation=augmentation, precision=args.precision, channels_last=args.channels_last)
 
     # model.export(output_path=args.output_path,name=args.name+".onnx",w=1280,h=720)
 
-    print("=== Training Complete ===")
+    if(torch.distributed.is_available() and torch.distributed.is_initialized()):
+        torch.distributed.destroy_process_group()
+
+    if(rank == 0):
+        print("=== Training Complete ===")
+
+def train_rank(rank, args):
+    # entry point of the processes started by --nprocs
+    train(args, rank)
+
+def quantize(args):
+    # quantize a trained model and compare it against the fp32 model on the validation set
+    print("=== Loading Datasets ===")
+
+    calibration_dataset = load_dataset(args, args.training_path, args.calibration_samples, apply_transforms=False)
+    val_dataset = load_dataset(args, args.validation_path, args.n_val, apply_transforms=False)
+
+    calibration_loader = make_loader(args, calibration_dataset, args.batch_size, shuffle=True)
+    val_loader = make_loader(args, val_dataset, 1, shuffle=False)
+
+    print("=== Quantizing ===")
+
+    # without a pretrained backbone the network is built with plain batch norms, which
+    # quantization folds into the convolutions, the weights come from the model file
+    fp32_model = RecognitionNetwork(device="cpu", pretrained_backbone=False)
+    fp32_model.load(args.input_model)
+    fp32_model.eval()
+
+    int8_model = RecognitionNetwork(device="cpu", pretrained_backbone=False)
+    int8_model.load(args.input_model)
+    int8_model.quantize(calibration_loader, samples=args.calibration_samples, engine=args.quantization_engine)
+    int8_model.save_scripted(os.path.join(args.output_path, args.name + "_int8.pt"))
+
+    print("=== Evaluating ===")
+
+    report = "Model {}, {} validation images\n".format(args.input_model, len(val_dataset))
+    for name, model in [("fp32", fp32_model), ("int8", int8_model)]:
+        iou = model.evaluate_iou(val_loader, len(val_loader))
+        latency = model.time_inference(val_loader, len(val_loader))
+        report += "{}: Val IOU [{:.4f}], Latency [{:.2f} ms/img]\n".format(name, iou, 1e3*latency)
+    print(report)
+
+    with open(os.path.join(args.output_path, "quantization_report.txt"), 'w') as f:
+        f.write(report)
+
+def export(args):
+    # export a trained model to onnx and check it against the pytorch model on the validation set
+    print("=== Exporting ===")
+
+    # the backbone weights come from the model file, so nothing is downloaded
+    model = RecognitionNetwork(device="cpu", pretrained_backbone=False)
+    model.load(args.input_model)
+    onnx_path = model.export(output_path=args.output_path, name=args.name + ".onnx", w=args.export_width, h=args.export_height)
+
+    from inference_backend import TorchBackend, OnnxRuntimeBackend
+    backends = [("torch", TorchBackend(model)), ("onnxruntime", OnnxRuntimeBackend(onnx_path))]
+
+    print("=== Checking Parity ===")
+
+    val_dataset = load_dataset(args, args.validation_path, args.n_val, apply_transforms=False)
+    val_loader = make_loader(args, val_dataset, 1, shuffle=False)
+
+    times = [0.0 for b in backends]
+    max_box_error = 0.0
+    max_score_error = 0.0
+    mismatched = 0
+    compared = 0
+    with torch.no_grad():
+        for i, data in enumerate(val_loader):
+            img_list = [data.imgs[0, :, :, :]]
+
+            predictions = []
+            for b, (name, backend) in enumerate(backends):
+                t0 = time.time()
+                predictions.append(backend.predict(img_list)[0])
+                times[b] += time.time() - t0
+
+            # detections with equal scores can come out in either order, so they are matched by iou
+            ref, test = [dict((k, v.detach().cpu().numpy()) for k, v in p.items()) for p in predictions]
+            rows, cols = match_boxes(box_iou(ref['boxes'], test['boxes']), min_iou=0.5)
+            if(len(rows) != ref['boxes'].shape[0] or len(cols) != test['boxes'].shape[0]
+               or not np.array_equal(ref['labels'][rows], test['labels'][cols])):
+                mismatched += 1
+            elif(len(rows) > 0):
+                max_box_error = max(max_box_error, np.abs(ref['boxes'][rows] - test['boxes'][cols]).max())
+                max_score_error = max(max_score_error, np.abs(ref['scores'][rows] - test['scores'][cols]).max())
+            compared += len(rows)
+
+    passed = mismatched == 0 and max_box_error < args.parity_tolerance and max_score_error < args.parity_score_tolerance
+    print("Parity {}: {} of {} images with different detections, {} matched detections, max box error = {:.2e} px, max score error = {:.2e}".format(
+        "PASSED" if passed and compared > 0 else "FAILED", mismatched, len(val_loader), compared, max_box_error, max_score_error))
+    for b, (name, backend) in enumerate(backends):
+        print("{}: Latency [{:.2f} ms/img]".format(name, 1e3 * times[b] / max(len(val_loader), 1)))
+    if(compared == 0):
+        # nothing detected in any image proves nothing about the exported model
+        sys.exit("No detections to compare, check the model and the validation set")
+    if(not passed):
+        sys.exit(1)
+
+def evaluate(args):
+    # detection metrics of a trained model on the validation set
+    print("=== Loading Datasets ===")
+
+    val_dataset = load_dataset(args, args.validation_path, args.n_val, apply_transforms=False)
+    val_loader = make_loader(args, val_dataset, args.batch_size, shuffle=False)
+
+    print("=== Evaluating ===")
+
+    model = RecognitionNetwork(pretrained_backbone=False)
+    model.load(args.input_model)
+
+    t0 = time.time()
+    metrics = model.evaluate(val_loader, len(val_loader), matching=args.matching)
+    t1 = time.time()
+
+    summary = metrics.summary()
+    report = "Model {}, {} validation images, {} matching\n".format(args.input_model, summary['images'], args.matching)
+    report += "Mean IOU [{:.4f}], mAP@{:.2f} [{:.4f}]\n".format(summary['mean_iou'], metrics.iou_threshold, summary['map'])
+    for c in range(metrics.num_classes):
+        report += "Class {}: Precision [{:.4f}], Recall [{:.4f}], AP [{:.4f}]\n".format(
+            c+1, summary['precision_{}'.format(c+1)], summary['recall_{}'.format(c+1)], summary['ap_{}'.format(c+1)])
+    report += "Evaluation time [{:.2f} s]\n".format(t1-t0)
+    print(report)
+
+    with open(os.path.join(args.output_path, "evaluation_report.txt"), 'w') as f:
+        f.write(report)
 
 def main(args):
     #save the configuration to a bash script
     if(not os.path.exists(args.output_path)):
-        os.mkdir(args.output_path)
+        os.makedirs(args.output_path, exist_ok=True)
 
     run_file = open(os.path.join(args.output_path,"run.sh"),'w')
     run_file.write("#!/usr/bin/env bash\n")
@@ -85,10 +264,21 @@ def main(args):
     run_file.close()
 
 
-    if(args.mode == "train"):
+    if(args.mode == "train" and args.nprocs > 1):
+        # local distributed run, mostly for testing before launching with torchrun
+        torch.multiprocessing.spawn(train_rank, args=(args,), nprocs=args.nprocs)
+    elif(args.mode == "train"):
         train(args)
     elif(args.mode == "generate_boxes"):
         generate_boxes(args)
+    elif(args.mode == "quantize"):
+        quantize(args)
+    elif(args.mode == "export"):
+        export(args)
+    elif(args.mode == "evaluate"):
+        evaluate(args)
+    elif(args.mode == "pack"):
+        pack(args)
 
 
 def parseargs():
@@ -113,12 +303,23 @@ def parseargs():
     input_model = "input/model"
     acc_step = 4
     sched_step = 1
+    eval_interval = 1
+    eval_samples = -1
+    calibration_samples = 200
+    quantization_engine = "fbgemm"
+    export_width = 1280
+    export_height = 720
+    parity_tolerance = 1e-2
+    parity_score_tolerance = 1e-3
+    matching = "greedy"
+    shard_size = 512
+    master_port = 29500
 
     parser = argparse.ArgumentParser(description='Object Recognition Trainer.')
 
     # general mode
     parser.add_argument('--mode', default="train",
-                        choices=["train", "generate_boxes"], help='mode of use')
+                        choices=["train", "generate_boxes", "quantize", "export", "evaluate", "pack"], help='mode of use')
 
     # information about the network
     parser.add_argument('--name', type=str, default='model',
@@ -143,12 +344,30 @@ def parseargs():
                         help="number of epochs between displaying and saving progress during training")
     parser.add_argument('--threads', type=int, default=loading_threads,
                         help="worker threads for loading data")
+    parser.add_argument('--augmentation_seed', type=int, default=-1,
+                        help="seed of the batch augmentation, offset by the rank in distributed runs, -1 for a random seed")
     parser.add_argument('--max_boxes', type=int, default=max_boxes,
                         help="maximum number of predicted boxes possible in an image")
     parser.add_argument('--acc_step', type=int, default=acc_step,
                         help="accumulation steps for gradient calculations")
     parser.add_argument('--sched_step', type=int, default=sched_step,
                         help="scheduler steps for learning rate changes")
+    parser.add_argument('--precision', default="fp32", choices=["fp32", "bf16", "fp16"],
+                        help="training precision, bf16 and fp16 run the forward pass under autocast and fp16 scales the losses")
+    parser.add_argument('--channels_last', action='store_true',
+                        help="train with channels last memory format")
+    parser.add_argument('--eval_interval', type=int, default=eval_interval,
+                        help="number of epochs between validation passes, the last epoch is always validated")
+    parser.add_argument('--eval_samples', type=int, default=eval_samples,
+                        help="maximum number of validation batches per validation pass, -1 for all")
+
+    # distributed training
+    parser.add_argument('--nprocs', type=int, default=1,
+                        help="number of local training processes to start, runs launched with torchrun use its ranks instead")
+    parser.add_argument('--dist_backend', default="gloo", choices=["gloo", "nccl"],
+                        help="process group backend for distributed training")
+    parser.add_argument('--master_port', type=int, default=master_port,
+                        help="port of rank 0 for runs started with --nprocs")
 
     # dataset locations
     parser.add_argument('--training_path', '-tr_data', type=str,
@@ -156,12 +375,42 @@ def parseargs():
     parser.add_argument('--validation_path', '-val_data', type=str,
                         default=validation_path, help="path to validation data")
 
+    # label generation
+    parser.add_argument('--regenerate_labels', action='store_true',
+                        help="regenerate every label file instead of only missing or outdated ones")
+
+    # packed datasets
+    parser.add_argument('--packed', action='store_true',
+                        help="read datasets from the shards written by --mode pack instead of decoding pngs")
+    parser.add_argument('--shard_size', type=int, default=shard_size,
+                        help="images per shard file when packing")
+
     # number of samples to load
     parser.add_argument('--n_train', type=int, default=num_training_samples,
                         help="number of samples to load for training")
     parser.add_argument('--n_val', type=int, default=num_validation_samples,
                         help="number of samples to load for validation")
 
+    # quantization parameters
+    parser.add_argument('--calibration_samples', type=int, default=calibration_samples,
+                        help="number of training images used to calibrate int8 quantization")
+    parser.add_argument('--quantization_engine', default=quantization_engine,
+                        choices=["fbgemm", "qnnpack"], help="quantized kernels to target, fbgemm for x86 and qnnpack for arm")
+
+    # export parameters
+    parser.add_argument('--export_width', type=int, default=export_width,
+                        help="input image width of the exported model")
+    parser.add_argument('--export_height', type=int, default=export_height,
+                        help="input image height of the exported model")
+    parser.add_argument('--parity_tolerance', type=float, default=parity_tolerance,
+                        help="maximum box difference in pixels between the exported and pytorch models")
+    parser.add_argument('--parity_score_tolerance', type=float, default=parity_score_tolerance,
+                        help="maximum score difference between the exported and pytorch models")
+
+    # evaluation parameters
+    parser.add_argument('--matching', default=matching,
+                        choices=["greedy", "hungarian"], help="how predicted boxes are matched to labeled boxes")
+
     return parser.parse_args()
 
 